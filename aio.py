@@ -0,0 +1,47 @@
+import os
+
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+import pool
+
+ASYNC_POOL_SIZE = int(os.getenv('ASYNC_POOL_SIZE', 20))
+ASYNC_MAX_OVERFLOW = int(os.getenv('ASYNC_MAX_OVERFLOW', 10))
+
+
+def async_url(url):
+    """Point a postgres:// or postgresql:// DATABASE_URL at the asyncpg driver."""
+    for prefix in ('postgres://', 'postgresql://', 'postgresql+psycopg2://'):
+        if url.startswith(prefix):
+            return 'postgresql+asyncpg://' + url[len(prefix):]
+    return url
+
+
+engine = create_async_engine(async_url(os.getenv('DATABASE_URL')),
+                             **pool.async_engine_options(ASYNC_POOL_SIZE, ASYNC_MAX_OVERFLOW))
+Session = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+# Reads are single statements, so they run outside a transaction and skip
+# the BEGIN and ROLLBACK round trips around each one.
+ReadSession = sessionmaker(engine.execution_options(isolation_level='AUTOCOMMIT'),
+                           class_=AsyncSession, expire_on_commit=False)
+
+
+async def rows(stmt):
+    """Run a select in a session of its own and return all of its rows.
+
+    Each call checks out its own connection, so independent statements
+    can be awaited together with asyncio.gather.
+    """
+    async with ReadSession() as session:
+        return (await session.execute(stmt)).all()
+
+
+async def scalars(stmt):
+    async with ReadSession() as session:
+        return (await session.execute(stmt)).scalars().all()
+
+
+async def first(stmt):
+    async with ReadSession() as session:
+        return (await session.execute(stmt)).first()
+
@@ -1,12 +1,36 @@
-from flask import Flask, jsonify, render_template, send_from_directory, request
+from flask import Flask, abort, jsonify, render_template, send_from_directory, request
 from apispec_webframeworks.flask import FlaskPlugin
 from apispec import APISpec
 from apispec.ext.marshmallow import MarshmallowPlugin
 import os
 from db import db_init, db
 from werkzeug.utils import secure_filename
-from models import Merchant, Media, Post, User, Item, Boost, Like, Comment
-import boto3
+from models import Merchant, Media, Post, User, Item, Boost, Like, Comment, user_version_seq
+from pagination import InvalidCursor, MAX_IDS, decode_cursor, parse_ids, parse_limit
+from hydrate import hydrate_posts
+from comments import comment_query, comment_page, comment_payloads
+from catalog import menu_query, menu_payloads, item_payload, merchant_record, item_version, item_record, menu_records
+import counters
+import serialize
+from streaming import stream_list, wants_stream
+import bulk
+import explain
+from conditional import conditional, make_etag, MENU_CACHE_CONTROL, POSTS_CACHE_CONTROL, POST_CACHE_CONTROL, COMMENTS_CACHE_CONTROL, SWAGGER_CACHE_CONTROL
+from compression import compress_response
+import metrics
+import zlib
+from sqlalchemy import func
+from sqlalchemy.exc import IntegrityError
+import feed
+from boosts import boost_index
+from ranking import ranker
+from media import s3, media_urls, active_ids, expire_pending, upload_stream, presign_upload, UPLOAD_MAX_SIZE
+from botocore.exceptions import ClientError
+import renditions
+from renditions import rendition_worker
+from likes import liked_posts
+import likebuffer
+from likebuffer import like_buffer
 from dto import *
 import uuid
 import datetime
@@ -23,12 +47,28 @@ if db_url.startswith("postgres://"):
 app.config['SQLALCHEMY_DATABASE_URI'] = db_url
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 
-s3 = boto3.client('s3', aws_access_key_id=os.getenv('S3_KEY'),
-                  aws_secret_access_key=os.getenv('S3_SECRET_ACCESS_KEY'))
-
 db_init(app)
 
 
+app.after_request(compress_response)
+
+
+@app.before_first_request
+def start_boost_index():
+    boost_index.start(app)
+
+
+@app.before_first_request
+def start_ranker():
+    ranker.start(app)
+
+
+@app.before_first_request
+def start_like_buffer():
+    if likebuffer.ENABLED:
+        like_buffer.start(app)
+
+
 @app.route('/media/upload', methods=['POST'])
 @cross_origin()
 def media_upload():
@@ -67,12 +107,106 @@ def media_upload():
         return 'file not uploaded', 400
     filename = secure_filename(pic.filename)
     unique_path = uuid.uuid4().hex
-    s3.put_object(Body=pic.read(), Bucket=os.getenv(
-        'S3_BUCKET'), Key=unique_path+'/'+filename)
+    upload_stream(pic.stream, media_urls.bucket,
+                  unique_path+'/'+filename, pic.mimetype)
     media = Media(uuid=unique_path, name=filename, mimetype=pic.mimetype)
     db.session.add(media)
     db.session.commit()
-    return {'id': media.id, 'media_url': media.get_url(os.getenv('S3_BUCKET'), os.getenv('S3_REGION'))}, 200
+    rendition_worker.submit(app, media.id)
+    return {'id': media.id, 'media_url': media_urls.url(media)}, 200
+
+
+@app.route('/media/upload-url', methods=['POST'])
+@cross_origin()
+def create_media_upload():
+    """ Start a direct upload
+        ---
+        post:
+            summary: get a presigned S3 upload for images or video
+            description: Creates a pending media and returns a presigned POST the client uploads the file to. Call /media/{id}/confirm once the upload has finished.
+            tags:
+                - Media
+            requestBody:
+                required: true
+                content:
+                    application/json:
+                        schema: CreateUploadRequestSchema
+
+            responses:
+                200:
+                    description: pending media id and presigned POST
+                    content:
+                        application/json:
+                            schema: CreateUploadResponseSchema
+
+                400:
+                    description: invalid request
+    """
+    if not request.is_json:
+        return 'invalid request', 400
+    req = request.get_json()
+    filename = secure_filename(req.get('filename') or '')
+    size = req.get('size')
+    if not filename or not req.get('content_type'):
+        return 'invalid request', 400
+    if not isinstance(size, int) or size < 1 or size > UPLOAD_MAX_SIZE:
+        return 'invalid size', 400
+    unique_path = uuid.uuid4().hex
+    media = Media(uuid=unique_path, name=filename,
+                  mimetype=req['content_type'], status='pending')
+    db.session.add(media)
+    db.session.commit()
+    post = presign_upload(media_urls.bucket, media.key,
+                          media.mimetype, size)
+    return {'id': media.id, 'url': post['url'], 'fields': post['fields']}, 200
+
+
+@app.route('/media/<int:id>/confirm', methods=['POST'])
+@cross_origin()
+def confirm_media_upload(id):
+    """ Confirm a direct upload
+        ---
+        post:
+            summary: activate media uploaded through a presigned POST
+            description: Checks the uploaded object and activates the media
+            tags:
+                - Media
+            parameters:
+                - in: path
+                  name: id
+                  required: true
+                  schema:
+                    type: integer
+                  description: media id
+
+            responses:
+                200:
+                    description: media id of the upload
+                    content:
+                        application/json:
+                            schema: UploadMediaResponseSchema
+
+                400:
+                    description: object missing or does not match the upload
+
+                404:
+                    description: media not found
+    """
+    media = Media.query.get_or_404(id)
+    if media.status != 'active':
+        try:
+            head = s3.head_object(Bucket=media_urls.bucket, Key=media.key)
+        except ClientError:
+            return 'file not uploaded', 400
+        if head['ContentLength'] > UPLOAD_MAX_SIZE or head.get('ContentType') != media.mimetype:
+            return 'uploaded file does not match', 400
+        # expire_pending may have deleted the row since it was read
+        if not Media.query.filter_by(id=id).update({'status': 'active'}):
+            db.session.rollback()
+            abort(404)
+        db.session.commit()
+        rendition_worker.submit(app, media.id)
+    return {'id': media.id, 'media_url': media_urls.url(media)}, 200
 
 
 spec = APISpec(
@@ -97,7 +231,15 @@ def swagger_docs(path=None):
 @app.route('/api/swagger.json')
 @cross_origin()
 def create_swagger_spec():
-    return jsonify(spec.to_dict())
+    spec_dict = spec.to_dict()
+    tag = make_etag('swagger', '%08x' % zlib.crc32(
+        repr(spec_dict).encode()))
+    return conditional(tag, SWAGGER_CACHE_CONTROL, lambda: jsonify(spec_dict))
+
+
+@app.route('/metrics')
+def get_metrics():
+    return jsonify(metrics.snapshot())
 
 
 @app.route('/merchant', methods=['POST'])
@@ -130,6 +272,8 @@ def create_merchant():
     if not request.is_json:
         return 'Invalid Request', 400
     req = request.get_json()
+    if not active_ids([req['logo_id']]):
+        return 'unknown or unconfirmed media', 400
     merchant = Merchant(name=req['name'], logo_id=req['logo_id'])
     db.session.add(merchant)
     db.session.commit()
@@ -164,11 +308,11 @@ def get_merchant(id):
                 404:
                     description: not found
     """
-    merchant = Merchant.query.get_or_404(id)
-    if not merchant:
+    version = db.session.query(Merchant.version).filter_by(id=id).scalar()
+    merchant = None if version is None else merchant_record(id, version)
+    if merchant is None:
         return 'invalid id', 404
-    media = Media.query.get_or_404(merchant.logo_id)
-    return jsonify({'name': merchant.name, 'logo_url': media.get_url(os.getenv('S3_BUCKET'), os.getenv('S3_REGION'))}), 200
+    return jsonify({'name': merchant['name'], 'logo_url': media_urls.url_for_key(merchant['logo_key'])}), 200
 
 
 @app.route('/merchant/<int:id>', methods=['PUT'])
@@ -198,6 +342,9 @@ def update_merchant(id):
                 204:
                     description: merchant details updated
 
+                400:
+                    description: unknown or unconfirmed logo
+
                 404:
                     description: merchant not found
     """
@@ -205,8 +352,12 @@ def update_merchant(id):
     if not merchant:
         return 'invalid id', 404
     req = request.get_json()
+    if not active_ids([req['logo_id']]):
+        return 'unknown or unconfirmed media', 400
     merchant.name = req['name']
     merchant.logo_id = req['logo_id']
+    merchant.version = Merchant.version + 1
+    feed.refresh_merchant(merchant.id)
     db.session.commit()
     return '', 204
 
@@ -282,13 +433,88 @@ def create_post(id):
         return 'Invalid Request', 400
     merchant = Merchant.query.get_or_404(id)
     req = request.get_json()
+    if not active_ids([req['media_id']]):
+        return 'unknown or unconfirmed media', 400
     post = Post(title=req['title'], media_id=req['media_id'],
                 user_id=merchant.id, items=req['items'])
     db.session.add(post)
+    db.session.flush()
+    counters.touch(Merchant, merchant.id)
+    feed.refresh_posts([post.id])
     db.session.commit()
     return {'id': post.id}, 200
 
 
+@app.route('/merchant/<int:id>/post/bulk', methods=['POST'])
+@cross_origin()
+def bulk_create_posts(id):
+    """ Bulk Create Posts
+        ---
+        post:
+            summary: create many posts
+            description: create posts from a JSON array, NDJSON or CSV; valid rows are created even when others fail
+            tags:
+                - Post
+            parameters:
+                - in: path
+                  name: id
+                  required: true
+                  schema:
+                    type: integer
+                  description: merchant id
+            requestBody:
+                required: true
+                content:
+                    application/json:
+                        schema:
+                            type: array
+                            items: CreatePostRequestSchema
+                    application/x-ndjson:
+                        schema: CreatePostRequestSchema
+                    text/csv:
+                        schema:
+                            type: string
+                            description: one post per line with a header row, items separated by ;
+                    multipart/form-data:
+                        schema:
+                            type: object
+                            properties:
+                                file:
+                                    type: string
+                                    format: binary
+            responses:
+                200:
+                    description: id or validation errors of each row
+                    content:
+                        application/json:
+                            schema: BulkImportResponseSchema
+
+                400:
+                    description: unreadable body or unsupported content type
+
+                404:
+                    description: merchant not found
+
+                413:
+                    description: too many rows
+    """
+    merchant = Merchant.query.get_or_404(id)
+    try:
+        results, ids = bulk.import_rows(bulk.read_rows(request, list_fields=('items',)), CreatePostRequestSchema(), Post, lambda data: {
+                                        'title': data.get('title'), 'media_id': data['media_id'], 'user_id': merchant.id, 'items': data.get('items')})
+    except bulk.UnsupportedFormat as e:
+        db.session.rollback()
+        return str(e), 400
+    except bulk.TooManyRows as e:
+        db.session.rollback()
+        return 'more than %d rows' % e.args[0], 413
+    if ids:
+        counters.touch(Merchant, merchant.id)
+        feed.refresh_posts(ids)
+    db.session.commit()
+    return {'created': len(ids), 'failed': len(results) - len(ids), 'results': results}, 200
+
+
 @app.route('/merchant/<int:id>/post/<int:post_id>', methods=['PUT'])
 @cross_origin()
 def update_post(id, post_id):
@@ -331,9 +557,14 @@ def update_post(id, post_id):
     Merchant.query.get_or_404(id)
     post = Post.query.get_or_404(post_id)
     req = request.get_json()
+    if not active_ids([req['media_id']]):
+        return 'unknown or unconfirmed media', 400
     post.title = req['title']
     post.media_id = req['media_id']
     post.items = req['items']
+    post.version = Post.version + 1
+    counters.touch(Merchant, post.user_id)
+    feed.refresh_posts([post.id])
     db.session.commit()
     return '', 204
 
@@ -371,25 +602,16 @@ def delete_post(id, post_id):
     """
     Merchant.query.get_or_404(id)
     post = Post.query.get_or_404(post_id)
+    Like.query.filter_by(post_id=post.id).delete()
+    Comment.query.filter_by(post_id=post.id).delete()
+    Boost.query.filter_by(post_id=post.id).delete()
+    feed.remove_post(post.id)
+    counters.touch(Merchant, post.user_id)
     db.session.delete(post)
     db.session.commit()
     return '', 204
 
 
-def get_items(items):
-    if items is None:
-        return []
-    itemDetails = []
-    for i in items:
-        item = Item.query.get(i)
-        if not item:
-            continue
-        media_item = Media.query.get_or_404(item.media_id)
-        itemDetails.append({'id': item.id, 'name': item.name, 'media_mimetype': media_item.mimetype, 'media_url': media_item.get_url(os.getenv(
-            'S3_BUCKET'), os.getenv('S3_REGION')), 'price': item.price, 'currency': item.currency, 'description': item.description, 'price': item.price, 'currency': item.currency})
-    return itemDetails
-
-
 @app.route('/merchant/<int:id>/post/<int:post_id>', methods=['GET'])
 @cross_origin()
 def get_merchant_post(id, post_id):
@@ -421,22 +643,62 @@ def get_merchant_post(id, post_id):
                         application/json:
                             schema: GetPostResponseSchema
 
+                304:
+                    description: not modified since the ETag in If-None-Match
+
                 404:
                     description: post not found
     """
-    post = Post.query.get(post_id)
-    media = Media.query.get_or_404(post.media_id)
-    merchant = Merchant.query.get_or_404(post.user_id)
-    logo = Media.query.get_or_404(merchant.logo_id)
-    items = get_items(post.items)
-    currentTime = datetime.datetime.utcnow()
-    boost = Boost.query.filter(
-        Boost.end_time > currentTime).filter_by(post_id=post.id).first()
-    isBoosted = False
-    if boost is not None and boost.id > 0:
-        isBoosted = True
-    return {'id': post.id, 'title': post.title, 'media_url': media.get_url(os.getenv('S3_BUCKET'), os.getenv('S3_REGION')), 'date_posted': post.date_posted.isoformat(), 'merchant_name': merchant.name, 'logo_url': logo.get_url(os.getenv(
-        'S3_BUCKET'), os.getenv('S3_REGION')), 'logo_mimetype': logo.mimetype, 'media_mimetype': media.mimetype, 'items': items, 'is_boosted': isBoosted, 'likes': len(post.likes), 'comments': len(post.comments)}, 200
+    stamp = db.session.query(Post.version, Merchant.version).join(
+        Merchant, Merchant.id == Post.user_id).filter(Post.id == post_id).first()
+    if stamp is None:
+        abort(404)
+    isBoosted = boost_index.is_boosted(post_id)
+    return conditional(make_etag('post', post_id, stamp[0], stamp[1], int(isBoosted), like_buffer.like_count(post_id, 0)), POST_CACHE_CONTROL,
+                       lambda: _get_merchant_post(post_id))
+
+
+def _get_merchant_post(post_id):
+    return serialize.response(GetPostResponseSchema, hydrate_posts([Post.query.get(post_id)])[0])
+
+
+@app.route('/posts', methods=['GET'])
+@cross_origin()
+def get_posts():
+    """ Get Posts
+        ---
+        get:
+            summary: get many posts by id
+            description: get the details of up to 200 posts in one request, in the order asked for
+            tags:
+                - Post
+            parameters:
+                - in: query
+                  name: ids
+                  required: true
+                  schema:
+                    type: string
+                  description: comma separated post ids
+
+            responses:
+                200:
+                    description: details of the posts that exist, and the ids that do not
+                    content:
+                        application/json:
+                            schema: GetPostsResponseSchema
+
+                400:
+                    description: missing, invalid or too many ids
+    """
+    try:
+        ids = parse_ids(request.args.getlist('ids'))
+    except ValueError:
+        return 'invalid ids', 400
+    if not ids or len(ids) > MAX_IDS:
+        return 'between 1 and %d ids required' % MAX_IDS, 400
+    posts = {post.id: post for post in Post.query.filter(Post.id.in_(ids))}
+    response = hydrate_posts([posts[i] for i in ids if i in posts])
+    return serialize.response(GetPostsResponseSchema, {'posts': response, 'missing': [i for i in ids if i not in posts]})
 
 
 @app.route('/merchant/<int:id>/posts', methods=['GET'])
@@ -456,6 +718,13 @@ def list_merchant_posts(id):
                   schema:
                     type: integer
                   description: merchant id
+                - in: query
+                  name: stream
+                  required: false
+                  schema:
+                    type: boolean
+                    default: false
+                  description: stream the posts as they are read from the database
 
             responses:
                 200:
@@ -464,27 +733,30 @@ def list_merchant_posts(id):
                         application/json:
                             schema: ListPostResponsesSchema
 
+                304:
+                    description: not modified since the ETag in If-None-Match
+
                 404:
                     description: post not found
     """
-    merchant = Merchant.query.get_or_404(id)
-    posts = Post.query.filter_by(user_id=merchant.id).all()
+    expiredBoosts = db.session.query(func.count(Boost.id)).join(Post, Post.id == Boost.post_id).filter(
+        Post.user_id == Merchant.id).filter(Boost.end_time <= datetime.datetime.utcnow()).scalar_subquery()
+    stamp = db.session.query(Merchant.version, func.count(Post.id), func.coalesce(func.sum(Post.version), 0), expiredBoosts).outerjoin(
+        Post, Post.user_id == Merchant.id).filter(Merchant.id == id).group_by(Merchant.id).first()
+    if stamp is None:
+        abort(404)
+    return conditional(make_etag('posts', id, *stamp, like_buffer.stamp()), POSTS_CACHE_CONTROL, lambda: _list_merchant_posts(id))
+
+
+def _list_merchant_posts(id):
+    if wants_stream():
+        return stream_list(ListPostResponsesSchema, 'posts', Post.query.filter_by(user_id=id).order_by(
+            Post.date_posted.desc(), Post.id.desc()), hydrate_posts)
+    posts = Post.query.filter_by(user_id=id).all()
     posts.sort(key=lambda x: (x.date_posted
                - datetime.datetime(1970, 1, 1)).total_seconds(), reverse=True)
-    logo = Media.query.get_or_404(merchant.logo_id)
-    response = []
-    currentTime = datetime.datetime.utcnow()
-    for post in posts:
-        media = Media.query.get_or_404(post.media_id)
-        boost = Boost.query.filter(
-            Boost.end_time > currentTime).filter_by(post_id=post.id).first()
-        isBoosted = False
-        if boost is not None and boost.id > 0:
-            isBoosted = True
-        response.append({'items': get_items(post.items), 'id': post.id, 'title': post.title, 'media_url': media.get_url(os.getenv(
-            'S3_BUCKET'), os.getenv('S3_REGION')), 'date_posted': post.date_posted.isoformat(), 'merchant_name': merchant.name, 'logo_url': logo.get_url(os.getenv(
-                'S3_BUCKET'), os.getenv('S3_REGION')), 'logo_mimetype': logo.mimetype, 'media_mimetype': media.mimetype, 'is_boosted': isBoosted, 'likes': len(post.likes), 'comments': len(post.comments)})
-    return {'posts': response}, 200
+    response = hydrate_posts(posts)
+    return serialize.response(ListPostResponsesSchema, {'posts': response})
 
 
 @app.route('/user/<int:id>/discover', methods=['GET'])
@@ -504,6 +776,36 @@ def get_discover(id):
                   schema:
                     type: integer
                   description: user id
+                - in: query
+                  name: limit
+                  required: false
+                  schema:
+                    type: integer
+                    minimum: 1
+                    maximum: 100
+                    default: 20
+                  description: maximum number of posts to return
+                - in: query
+                  name: cursor
+                  required: false
+                  schema:
+                    type: string
+                  description: next_cursor from the previous page
+                - in: query
+                  name: order
+                  required: false
+                  schema:
+                    type: string
+                    enum: [recent, ranked]
+                    default: recent
+                  description: newest first, or by ranking score
+                - in: query
+                  name: stream
+                  required: false
+                  schema:
+                    type: boolean
+                    default: false
+                  description: stream every post after cursor, ignoring limit; recent order only
             responses:
                 200:
                     description: post details
@@ -511,33 +813,37 @@ def get_discover(id):
                         application/json:
                             schema: ListDiscoverResponseSchema
 
+                400:
+                    description: invalid limit, cursor or order
+
                 404:
                     description: post not found
     """
     user = User.query.get_or_404(id)
-    posts = Post.query.all()
-    posts.sort(key=lambda x: (x.date_posted
-               - datetime.datetime(1970, 1, 1)).total_seconds(), reverse=True)
-    response = []
-    currentTime = datetime.datetime.utcnow()
-    for post in posts:
-        media = Media.query.get_or_404(post.media_id)
-        merchant = Merchant.query.get_or_404(post.user_id)
-        logo = Media.query.get_or_404(merchant.logo_id)
-        boost = Boost.query.filter(
-            Boost.end_time > currentTime).filter_by(post_id=post.id).first()
-        isBoosted = False
-        if boost is not None and boost.id > 0:
-            isBoosted = True
-        isLiked = False
-        like = Like.query.filter_by(
-            post_id=post.id).filter_by(user_id=user.id).first()
-        if like is not None:
-            isLiked = True
-        response.append({'items': get_items(post.items), 'id': post.id, 'title': post.title, 'media_url': media.get_url(os.getenv(
-            'S3_BUCKET'), os.getenv('S3_REGION')), 'date_posted': post.date_posted.isoformat(), 'merchant_name': merchant.name, 'logo_url': logo.get_url(os.getenv(
-                'S3_BUCKET'), os.getenv('S3_REGION')), 'logo_mimetype': logo.mimetype, 'media_mimetype': media.mimetype, 'merchant_id': merchant.id, 'is_boosted': isBoosted, 'likes': len(post.likes), 'comments': len(post.comments), 'is_liked': isLiked})
-    return {'posts': response}, 200
+    limit = parse_limit(request.args.get('limit'))
+    if limit is None:
+        return 'invalid limit', 400
+    order = request.args.get('order', 'recent')
+    if wants_stream():
+        if order != 'recent':
+            return 'only recent order can be streamed', 400
+        try:
+            query = feed.recent_query(request.args.get('cursor'))
+        except InvalidCursor:
+            return 'invalid cursor', 400
+        return stream_list(ListDiscoverResponseSchema, 'posts', query, lambda entries: feed.discover_payloads(entries, user), extra={'next_cursor': None})
+    if order == 'recent':
+        page = feed.recent_page
+    elif order == 'ranked':
+        page = feed.ranked_page
+    else:
+        return 'invalid order', 400
+    try:
+        entries, nextCursor = page(limit, request.args.get('cursor'))
+    except InvalidCursor:
+        return 'invalid cursor', 400
+    response = feed.discover_payloads(entries, user)
+    return serialize.response(ListDiscoverResponseSchema, {'posts': response, 'next_cursor': nextCursor})
 
 
 @app.route('/user', methods=['POST'])
@@ -570,6 +876,8 @@ def create_user():
     if not request.is_json:
         return 'Invalid Request', 400
     req = request.get_json()
+    if not active_ids([req['profile_id']]):
+        return 'unknown or unconfirmed media', 400
     user = User(name=req['name'], media_id=req['profile_id'])
     db.session.add(user)
     db.session.commit()
@@ -603,13 +911,19 @@ def update_user(id):
                 204:
                     description: user details updated
 
+                400:
+                    description: unknown or unconfirmed profile picture
+
                 404:
                     description: user not found
     """
     user = User.query.get_or_404(id)
     req = request.get_json()
+    if not active_ids([req['profile_id']]):
+        return 'unknown or unconfirmed media', 400
     user.name = req['name']
     user.media_id = req['profile_id']
+    user.version = user_version_seq.next_value()
     db.session.commit()
     return '', 204
 
@@ -652,13 +966,85 @@ def create_item(id):
         return 'Invalid Request', 400
     req = request.get_json()
     Merchant.query.get_or_404(id)
+    if not active_ids([req['media_id']]):
+        return 'unknown or unconfirmed media', 400
     item = Item(name=req['name'], media_id=req['media_id'],
                 merchant_id=id, price=req['price'], currency=req['currency'], description=req['description'])
     db.session.add(item)
+    counters.touch(Merchant, id)
     db.session.commit()
     return {'id': item.id}, 200
 
 
+@app.route('/merchant/<int:id>/item/bulk', methods=['POST'])
+@cross_origin()
+def bulk_create_items(id):
+    """ Bulk Create Menu Items
+        ---
+        post:
+            summary: create many menu items
+            description: create menu items from a JSON array, NDJSON or CSV; valid rows are created even when others fail
+            tags:
+                - Menu
+            parameters:
+                - in: path
+                  name: id
+                  required: true
+                  schema:
+                    type: integer
+                  description: merchant id
+            requestBody:
+                required: true
+                content:
+                    application/json:
+                        schema:
+                            type: array
+                            items: CreateItemSchema
+                    application/x-ndjson:
+                        schema: CreateItemSchema
+                    text/csv:
+                        schema:
+                            type: string
+                            description: one item per line with a header row
+                    multipart/form-data:
+                        schema:
+                            type: object
+                            properties:
+                                file:
+                                    type: string
+                                    format: binary
+            responses:
+                200:
+                    description: id or validation errors of each row
+                    content:
+                        application/json:
+                            schema: BulkImportResponseSchema
+
+                400:
+                    description: unreadable body or unsupported content type
+
+                404:
+                    description: merchant not found
+
+                413:
+                    description: too many rows
+    """
+    merchant = Merchant.query.get_or_404(id)
+    try:
+        results, ids = bulk.import_rows(bulk.read_rows(request), CreateItemSchema(), Item, lambda data: {'name': data['name'], 'media_id': data['media_id'], 'merchant_id': merchant.id, 'price': data.get(
+            'price', 0), 'currency': data['currency'], 'description': data.get('description')})
+    except bulk.UnsupportedFormat as e:
+        db.session.rollback()
+        return str(e), 400
+    except bulk.TooManyRows as e:
+        db.session.rollback()
+        return 'more than %d rows' % e.args[0], 413
+    if ids:
+        counters.touch(Merchant, merchant.id)
+    db.session.commit()
+    return {'created': len(ids), 'failed': len(results) - len(ids), 'results': results}, 200
+
+
 @app.route('/merchant/<int:id>/item/<int:item_id>', methods=['PUT'])
 @cross_origin()
 def update_item(id, item_id):
@@ -704,11 +1090,15 @@ def update_item(id, item_id):
     req = request.get_json()
     Merchant.query.get_or_404(id)
     item = Item.query.get_or_404(item_id)
+    if not active_ids([req['media_id']]):
+        return 'unknown or unconfirmed media', 400
     item.name = req['name']
     item.media_id = req['media_id']
     item.price = req['price']
     item.currency = req['currency']
     item.description = req['description']
+    counters.touch(Merchant, item.merchant_id)
+    feed.refresh_item(item.id)
     db.session.commit()
     return '', 204
 
@@ -747,10 +1137,11 @@ def get_item(id, item_id):
                 404:
                     description: item not found
     """
-    Merchant.query.get_or_404(id)
-    item = Item.query.get_or_404(item_id)
-    media = Media.query.get_or_404(item.media_id)
-    return {'id': item.id, 'name': item.name, 'media_mimetype': media.mimetype, 'media_url': media.get_url(os.getenv('S3_BUCKET'), os.getenv('S3_REGION')), 'price': item.price, 'currency': item.currency, 'description': item.description}, 200
+    version = item_version(id, item_id)
+    item = None if version is None else item_record(item_id, version)
+    if item is None:
+        abort(404)
+    return serialize.response(GetItemResponseSchema, item_payload(item))
 
 
 @app.route('/merchant/<int:id>/menu', methods=['GET'])
@@ -770,6 +1161,13 @@ def get_menu(id):
                   schema:
                     type: integer
                   description: merchant id
+                - in: query
+                  name: stream
+                  required: false
+                  schema:
+                    type: boolean
+                    default: false
+                  description: stream the items as they are read from the database
             responses:
                 200:
                     description: merchant menu
@@ -777,18 +1175,22 @@ def get_menu(id):
                         application/json:
                             schema: ListMenuResponseSchema
 
+                304:
+                    description: not modified since the ETag in If-None-Match
+
                 400:
                     description: invalid request
     """
-    Merchant.query.get_or_404(id)
-    items = Item.query.filter_by(merchant_id=id).all()
-    items.sort(key=lambda x: x.name)
-    response = []
-    for item in items:
-        media = Media.query.get_or_404(item.media_id)
-        response.append({'id': item.id, 'name': item.name, 'media_mimetype': media.mimetype,
-                        'media_url': media.get_url(os.getenv('S3_BUCKET'), os.getenv('S3_REGION')), 'price': item.price, 'currency': item.currency, 'description': item.description})
-    return {'items': response}, 200
+    version = db.session.query(Merchant.version).filter_by(id=id).scalar()
+    if version is None:
+        abort(404)
+    return conditional(make_etag('menu', id, version), MENU_CACHE_CONTROL, lambda: _get_menu(id, version))
+
+
+def _get_menu(id, version):
+    if wants_stream():
+        return stream_list(ListMenuResponseSchema, 'items', menu_query(id), menu_payloads)
+    return serialize.response(ListMenuResponseSchema, {'items': [item_payload(item) for item in menu_records(id, version)]})
 
 
 @app.route('/post/<int:id>/boost', methods=['POST'])
@@ -828,14 +1230,20 @@ def boost_post(id):
     req = request.get_json()
     currentTime = datetime.datetime.utcnow()
     endtime = currentTime + datetime.timedelta(days=req['days'])
+    if boost_index.is_boosted(id, currentTime):
+        return '', 400
     existingBoost = Boost.query.filter(
-        Boost.end_time > currentTime).filter_by(post_id=id).all()
-    if existingBoost is not None and len(existingBoost) > 0:
+        Boost.end_time > currentTime).filter_by(post_id=id).first()
+    if existingBoost is not None:
+        boost_index.add(id, existingBoost.end_time)
         return '', 400
     Post.query.get_or_404(id)
     boost = Boost(post_id=id, end_time=endtime)
     db.session.add(boost)
+    counters.touch(Post, id)
+    feed.set_boost(id, endtime)
     db.session.commit()
+    boost_index.add(id, endtime)
     return {'success': True}, 200
 
 
@@ -870,21 +1278,27 @@ def update_like(id):
 
                 400:
                     description: invalid request
+
+                404:
+                    description: post or user not found
     """
     if not request.is_json:
         return 'invalid request', 400
     req = request.get_json()
-    Post.query.get_or_404(id)
-    like = Like.query.filter_by(post_id=id).filter_by(
-        user_id=req['user_id']).first()
-    status = False
-    if like is not None:
-        db.session.delete(like)
+    if like_buffer.running:
+        result = like_buffer.toggle(id, req['user_id'])
+        if result is None:
+            abort(404)
+        total_likes, status = result
+        version = None
     else:
-        db.session.add(Like(user_id=req['user_id'], post_id=id))
-        status = True
-    db.session.commit()
-    total_likes = len(Like.query.filter_by(post_id=id).all())
+        try:
+            total_likes, status, version = counters.toggle_like(id, req['user_id'])
+            db.session.commit()
+        except IntegrityError:
+            db.session.rollback()
+            abort(404)
+    liked_posts.set_liked(req['user_id'], id, status, version)
     return {'total_likes': total_likes, 'is_liked': status}, 200
 
 
@@ -924,6 +1338,8 @@ def add_comment(id):
     user = User.query.get_or_404(req['user_id'])
     c = Comment(user_id=user.id, post_id=id, content=req['content'])
     db.session.add(c)
+    feed.set_counts(id, comment_count=counters.bump(
+        Post.comment_count, id, 1))
     db.session.commit()
     return '', 204
 
@@ -945,27 +1361,65 @@ def list_comments(id):
                   schema:
                     type: integer
                   description: post id
+                - in: query
+                  name: limit
+                  required: false
+                  schema:
+                    type: integer
+                    minimum: 1
+                    maximum: 100
+                    default: 20
+                  description: maximum number of comments to return
+                - in: query
+                  name: cursor
+                  required: false
+                  schema:
+                    type: string
+                  description: next_cursor from the previous page
+                - in: query
+                  name: stream
+                  required: false
+                  schema:
+                    type: boolean
+                    default: false
+                  description: stream every comment after cursor, ignoring limit
 
             responses:
                 200:
-                    description: boost status
+                    description: oldest comments first
                     content:
                         application/json:
                             schema: ListCommentsResponseSchema
 
+                304:
+                    description: not modified since the ETag in If-None-Match
+
                 400:
-                    description: invalid request
+                    description: invalid limit or cursor
     """
-    Post.query.get_or_404(id)
-    c = Comment.query.filter_by(post_id=id).all()
-    c.sort(key=lambda x: x.date_posted)
-    comments = []
-    for comment in c:
-        user = User.query.get_or_404(comment.user_id)
-        media = Media.query.get_or_404(user.media_id)
-        comments.append({'id': comment.id, 'user_name': user.name, 'profile_url': media.get_url(os.getenv(
-            'S3_BUCKET'), os.getenv('S3_REGION')), 'profile_mimetype': media.mimetype, 'content': comment.content, 'date_posted': comment.date_posted.isoformat()})
-    return {'comments': comments}, 200
+    # Comment bodies show their authors' current profiles, so the tag also
+    # carries the latest profile version of any user.
+    profilesVersion = db.session.query(func.max(User.version)).scalar_subquery()
+    stamp = db.session.query(Post.comment_count, profilesVersion).filter_by(id=id).first()
+    if stamp is None:
+        abort(404)
+    limit = parse_limit(request.args.get('limit'))
+    if limit is None:
+        return 'invalid limit', 400
+    cursor = request.args.get('cursor')
+    if cursor:
+        try:
+            decode_cursor(cursor)
+        except InvalidCursor:
+            return 'invalid cursor', 400
+    return conditional(make_etag('comments', id, *stamp), COMMENTS_CACHE_CONTROL, lambda: _list_comments(id, limit, cursor))
+
+
+def _list_comments(id, limit, cursor):
+    if wants_stream():
+        return stream_list(ListCommentsResponseSchema, 'comments', comment_query(id, cursor), comment_payloads, extra={'next_cursor': None})
+    page, nextCursor = comment_page(id, limit, cursor)
+    return serialize.response(ListCommentsResponseSchema, {'comments': comment_payloads(page), 'next_cursor': nextCursor})
 
 
 with app.test_request_context():
@@ -974,15 +1428,20 @@ with app.test_request_context():
     spec.path(view=update_merchant)
     spec.path(view=delete_merchant)
     spec.path(view=create_post)
+    spec.path(view=bulk_create_posts)
     spec.path(view=update_post)
     spec.path(view=delete_post)
     spec.path(view=get_merchant_post)
     spec.path(view=list_merchant_posts)
+    spec.path(view=get_posts)
     spec.path(view=media_upload)
+    spec.path(view=create_media_upload)
+    spec.path(view=confirm_media_upload)
     spec.path(view=get_discover)
     spec.path(view=create_user)
     spec.path(view=update_user)
     spec.path(view=create_item)
+    spec.path(view=bulk_create_items)
     spec.path(view=update_item)
     spec.path(view=get_item)
     spec.path(view=get_menu)
@@ -992,5 +1451,49 @@ with app.test_request_context():
     spec.path(view=list_comments)
 
 
+@app.cli.command('reconcile-counts')
+def reconcile_counts():
+    """Rebuild post and feed like and comment counts from likes and comments."""
+    print('corrected %d posts' % counters.reconcile())
+
+
+@app.cli.command('expire-uploads')
+def expire_uploads():
+    """Delete direct uploads left pending for longer than PENDING_MEDIA_TTL seconds."""
+    print('expired %d pending media' % expire_pending())
+
+
+@app.cli.command('generate-renditions')
+def generate_renditions():
+    """Generate missing renditions for active image media."""
+    pending = Media.query.filter(Media.renditions.is_(None)).filter(
+        Media.status == 'active').filter(Media.mimetype.like('image/%')).all()
+    for media in pending:
+        try:
+            renditions.generate(media)
+        except Exception as e:
+            db.session.rollback()
+            print('media %d failed: %s' % (media.id, e))
+    print('processed %d media' % len(pending))
+
+
+@app.cli.command('rebuild-feed')
+def rebuild_feed():
+    """Rebuild the materialized discover feed from posts."""
+    print('rebuilt %d feed entries' % feed.rebuild())
+
+
+@app.cli.command('check-indexes')
+def check_indexes():
+    """Check that the hot queries are planned on indexes."""
+    failures = explain.check_indexes()
+    for name, plan in failures.items():
+        print('%s does not use an index:' % name)
+        print('\n'.join(plan))
+    if failures:
+        raise SystemExit(1)
+    print('all hot queries use an index')
+
+
 if __name__ == '__main__':
     app.run(debug=True)
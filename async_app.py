@@ -0,0 +1,291 @@
+"""Asyncio serving mode, run with hypercorn instead of gunicorn:
+
+    hypercorn async_app:app --worker-class asyncio
+
+The read-heavy post and discover endpoints are served by the Quart
+handlers below, which wait on the database through SQLAlchemy's asyncio
+engine and run a request's independent lookups concurrently. Every other
+request, and any request asking for a streamed response, is handed to
+the Flask app on a worker thread, so both modes answer the same API.
+Media uploads are spooled to a temporary file as they arrive and sent on
+to S3 in bounded parts, as the Flask view does.
+"""
+import asyncio
+import functools
+import os
+import uuid
+
+from hypercorn.middleware import AsyncioWSGIMiddleware
+from quart import Quart, Response, abort, request
+from sqlalchemy import select
+from werkzeug.exceptions import HTTPException
+from werkzeug.urls import url_decode
+from werkzeug.utils import secure_filename
+
+import aio
+import compression
+import feed
+import serialize
+from app import app as flask_app, start_boost_index, start_like_buffer, start_ranker
+from boosts import boost_index
+from catalog import cached_item_records, item_cache, item_rows, store_item_records
+from conditional import make_etag, matching_tag, POST_CACHE_CONTROL
+from db import db
+from dto import GetPostResponseSchema, GetPostsResponseSchema, ListDiscoverResponseSchema, UploadMediaResponseSchema
+from hydrate import post_payloads
+from likebuffer import like_buffer
+from likes import liked_posts, liked_subset
+from media import media_urls, upload_stream, UPLOAD_MAX_SIZE
+from models import FeedEntry, Like, Media, Merchant, Post, User
+from pagination import InvalidCursor, MAX_IDS, parse_ids, parse_limit
+from renditions import rendition_worker
+from streaming import wants_stream
+
+ASYNC_MAX_REQUESTS = int(os.getenv('ASYNC_MAX_REQUESTS', aio.ASYNC_POOL_SIZE // 2))
+# The WSGI middleware holds a request's whole body in memory before the
+# Flask app sees it, so it gets a tighter limit than uploads do.
+WSGI_MAX_BODY_SIZE = int(os.getenv('WSGI_MAX_BODY_SIZE', 16 * 1024 * 1024))
+
+quart_app = Quart(__name__, static_folder=None)
+quart_app.config['MAX_CONTENT_LENGTH'] = UPLOAD_MAX_SIZE
+
+admission = None
+
+
+def _in_app_context(fn, *args):
+    """Run fn with the Flask app's context on a worker thread."""
+    def run():
+        with flask_app.app_context():
+            try:
+                return fn(*args)
+            finally:
+                db.session.remove()
+    return asyncio.get_running_loop().run_in_executor(None, run)
+
+
+def _start_background():
+    start_boost_index()
+    start_ranker()
+    start_like_buffer()
+
+
+@quart_app.before_serving
+async def startup():
+    global admission
+    admission = asyncio.Semaphore(ASYNC_MAX_REQUESTS)
+    await _in_app_context(_start_background)
+
+
+@quart_app.after_serving
+async def shutdown():
+    await aio.engine.dispose()
+
+
+@quart_app.after_request
+async def cors(response):
+    if 'Origin' in request.headers:
+        response.headers['Access-Control-Allow-Origin'] = '*'
+    return response
+
+
+@quart_app.after_request
+async def compress_response(response):
+    encoding = compression.negotiate(response, request.accept_encodings)
+    if encoding is None:
+        return response
+    return compression.compress_body(response, encoding, request.path, await response.get_data())
+
+
+def admitted(view):
+    """Run view only while fewer than ASYNC_MAX_REQUESTS admitted views are running.
+
+    Past that, requests wait here before taking any connections. Letting
+    them all in interleaves their queries in the pool queue and stretches
+    the tail latency of every one of them.
+    """
+    @functools.wraps(view)
+    async def wrapper(*args, **kwargs):
+        async with admission:
+            return await view(*args, **kwargs)
+    return wrapper
+
+
+def _json(schema, payload, status=200):
+    return Response(serialize.encode(schema, payload), status=status, mimetype='application/json')
+
+
+async def _conditional(tag, cache_control, build):
+    """conditional.conditional for coroutine views; build is awaited."""
+    variant = matching_tag(tag, request.if_none_match)
+    if variant is not None:
+        response = Response('', 304)
+        response.set_etag(variant)
+    else:
+        response = await build()
+        response.set_etag(tag)
+    response.headers['Cache-Control'] = cache_control
+    return response
+
+
+async def load_page(posts):
+    """hydrate.load_page with its merchant, media and item lookups run concurrently.
+
+    Items missing from the cache are loaded alongside the merchants. Cached
+    records whose merchant turns out to have a newer version are reloaded
+    after that, which only happens for items written since they were cached.
+    """
+    itemIds = {i for post in posts for i in (post.items or [])}
+    absent = [i for i in itemIds if item_cache.get(i) is None]
+    lookups = [aio.rows(select(Merchant, Media).join(Media, Media.id == Merchant.logo_id).where(
+                   Merchant.id.in_({post.user_id for post in posts}))),
+               aio.scalars(select(Media).where(Media.id.in_({post.media_id for post in posts})))]
+    if absent:
+        lookups.append(aio.rows(item_rows(absent)))
+    results = await asyncio.gather(*lookups)
+    merchants = {merchant.id: (merchant, logo) for merchant, logo in results[0]}
+    records = store_item_records(results[2]) if absent else {}
+    cached, stale = cached_item_records(
+        itemIds.difference(absent), {id: merchant.version for id, (merchant, logo) in merchants.items()})
+    records.update(cached)
+    if stale:
+        records.update(store_item_records(await aio.rows(item_rows(stale))))
+    return merchants, {m.id: m for m in results[1]}, records
+
+
+async def hydrate_posts(posts):
+    if not posts:
+        return []
+    return post_payloads(posts, *(await load_page(posts)))
+
+
+async def liked_among(user_id, version, post_ids):
+    liked = liked_posts.peek(user_id, version)
+    if liked is None:
+        liked = liked_posts.store(user_id, version, await aio.scalars(select(Like.post_id).where(
+            Like.user_id == user_id).order_by(Like.post_id)))
+    return liked_subset(liked, post_ids)
+
+
+@quart_app.route('/merchant/<int:id>/post/<int:post_id>', methods=['GET'])
+@admitted
+async def get_merchant_post(id, post_id):
+    row = await aio.first(select(Post, Merchant.version).join(
+        Merchant, Merchant.id == Post.user_id).where(Post.id == post_id))
+    if row is None:
+        abort(404)
+    post, merchantVersion = row
+    isBoosted = boost_index.is_boosted(post_id)
+    tag = make_etag('post', post_id, post.version, merchantVersion, int(isBoosted), like_buffer.like_count(post_id, 0),
+                    query_string=request.query_string)
+
+    async def build():
+        return _json(GetPostResponseSchema, (await hydrate_posts([post]))[0])
+    return await _conditional(tag, POST_CACHE_CONTROL, build)
+
+
+@quart_app.route('/posts', methods=['GET'])
+@admitted
+async def get_posts():
+    try:
+        ids = parse_ids(request.args.getlist('ids'))
+    except ValueError:
+        return 'invalid ids', 400
+    if not ids or len(ids) > MAX_IDS:
+        return 'between 1 and %d ids required' % MAX_IDS, 400
+    posts = {post.id: post for post in await aio.scalars(select(Post).where(Post.id.in_(ids)))}
+    response = await hydrate_posts([posts[i] for i in ids if i in posts])
+    return _json(GetPostsResponseSchema, {'posts': response, 'missing': [i for i in ids if i not in posts]})
+
+
+async def _recent_page(limit, cursor):
+    where, order = feed.recent_criteria(cursor)
+    return feed.split_page(await aio.scalars(
+        select(FeedEntry).where(*where).order_by(*order).limit(limit + 1)), limit)
+
+
+async def _ranked_page(limit, cursor):
+    post_ids, nextCursor = await _in_app_context(feed.ranked_ids, limit, cursor)
+    if not post_ids:
+        return [], nextCursor
+    rows = await aio.scalars(select(FeedEntry).where(FeedEntry.post_id.in_(post_ids)))
+    entries = {entry.post_id: entry for entry in rows}
+    return [entries[i] for i in post_ids if i in entries], nextCursor
+
+
+def _user(id):
+    return aio.first(select(User.id, User.likes_version).where(User.id == id))
+
+
+@quart_app.route('/user/<int:id>/discover', methods=['GET'])
+@admitted
+async def get_discover(id):
+    # Answers in the sync view's order: an unknown user is a 404 before
+    # any complaint about the query. The user is looked up alongside the
+    # page, and first only on the way to a 400.
+    limit = parse_limit(request.args.get('limit'))
+    order = request.args.get('order', 'recent')
+    if limit is None or order not in ('recent', 'ranked'):
+        if await _user(id) is None:
+            abort(404)
+        return ('invalid limit' if limit is None else 'invalid order'), 400
+    cursor = request.args.get('cursor')
+    if order == 'recent':
+        page = _recent_page(limit, cursor)
+    else:
+        page = _ranked_page(limit, cursor)
+    try:
+        user, page = await asyncio.gather(_user(id), page)
+    except InvalidCursor:
+        user, page = await _user(id), None
+    if user is None:
+        abort(404)
+    if page is None:
+        return 'invalid cursor', 400
+    # The liked ids are read after the user row, so an array cached under
+    # this likes_version holds at least every like it covers.
+    entries, nextCursor = page
+    liked = await liked_among(id, user.likes_version, [entry.post_id for entry in entries])
+    response = feed.entry_payloads(entries, liked)
+    return _json(ListDiscoverResponseSchema, {'posts': response, 'next_cursor': nextCursor})
+
+
+@quart_app.route('/media/upload', methods=['POST'])
+async def media_upload():
+    files = await request.files
+    pic = files.get('file')
+    if not pic:
+        return 'file not uploaded', 400
+    filename = secure_filename(pic.filename)
+    unique_path = uuid.uuid4().hex
+    await asyncio.get_running_loop().run_in_executor(
+        None, upload_stream, pic.stream, media_urls.bucket, unique_path+'/'+filename, pic.mimetype)
+    media = Media(uuid=unique_path, name=filename, mimetype=pic.mimetype)
+    async with aio.Session() as session:
+        session.add(media)
+        await session.commit()
+    rendition_worker.submit(flask_app, media.id)
+    return _json(UploadMediaResponseSchema, {'id': media.id, 'media_url': media_urls.url(media)})
+
+
+wsgi_app = AsyncioWSGIMiddleware(flask_app, max_body_size=WSGI_MAX_BODY_SIZE)
+_async_routes = quart_app.url_map.bind('localhost')
+
+
+def _serves(scope):
+    """Whether quart_app, rather than the Flask app, answers scope."""
+    if scope['type'] != 'http':
+        return True
+    if scope['method'] == 'OPTIONS' or wants_stream(url_decode(scope['query_string'])):
+        return False
+    try:
+        _async_routes.match(scope['path'], scope['method'])
+    except HTTPException:
+        return False
+    return True
+
+
+async def app(scope, receive, send):
+    if _serves(scope):
+        await quart_app(scope, receive, send)
+    else:
+        await wsgi_app(scope, receive, send)
@@ -0,0 +1,225 @@
+"""Compare requests/s and latency of the sync and async serving modes.
+
+Run against a scratch database that has been migrated to head:
+
+    DATABASE_URL=... python bench/async_bench.py --seed 2000 --concurrency 200
+
+Starts the Flask app under gunicorn and async_app under hypercorn with
+the same number of worker processes, then drives each with concurrent
+keep-alive clients over a mix of post, multi-get and discover requests
+for --duration seconds. --seed first fills the database with that many
+posts, with merchants, items, users and likes to match.
+
+With a database on the same host every query returns at once and the
+run measures CPU cost alone. --db-latency routes the servers' database
+connections through a local proxy that delays every reply by that many
+milliseconds, to stand in for the network between app and database.
+"""
+import argparse
+import asyncio
+import multiprocessing
+import os
+import random
+import subprocess
+import sys
+import time
+
+import aiohttp
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def seed(posts):
+    from app import app
+    from db import db
+    import feed
+    from models import Media, Merchant, Item, Post, User, Like
+
+    with app.app_context():
+        media = Media(uuid='bench', name='bench.jpg', mimetype='image/jpeg')
+        db.session.add(media)
+        db.session.flush()
+        merchants = [Merchant(name='bench %d' % i, logo_id=media.id) for i in range(50)]
+        db.session.add_all(merchants)
+        db.session.flush()
+        items = [Item(name='item %d' % i, merchant_id=merchants[i % 50].id, media_id=media.id,
+                      currency='SGD', price=100 + i, description='bench item') for i in range(500)]
+        users = [User(name='bench%d' % i, media_id=media.id) for i in range(100)]
+        db.session.add_all(items + users)
+        db.session.flush()
+        rows = [Post(title='bench post %d' % i, user_id=merchants[i % 50].id, media_id=media.id,
+                     items=[items[(i * 3 + k) % 500].id for k in range(3)],
+                     like_count=5 if i % 7 == 0 else 0) for i in range(posts)]
+        db.session.add_all(rows)
+        db.session.flush()
+        db.session.add_all([Like(post_id=post.id, user_id=user.id)
+                            for post in rows[::7] for user in users[:5]])
+        db.session.flush()
+        feed.refresh_posts([post.id for post in rows])
+        db.session.commit()
+        return [post.id for post in rows], [(post.user_id, post.id) for post in rows], [user.id for user in users]
+
+
+def existing():
+    from app import app
+    from db import db
+    from models import Post, User
+
+    with app.app_context():
+        posts = db.session.query(Post.id, Post.user_id).all()
+        users = [row[0] for row in db.session.query(User.id)]
+    return [row[0] for row in posts], [(row[1], row[0]) for row in posts], users
+
+
+def _proxy(port, target, latency):
+    loop = asyncio.new_event_loop()
+
+    async def pipe(reader, writer, delay):
+        while True:
+            data = await reader.read(65536)
+            if not data:
+                break
+            if delay:
+                loop.call_later(delay, writer.write, data)
+            else:
+                writer.write(data)
+        loop.call_later(delay, writer.close)
+
+    async def handle(clientReader, clientWriter):
+        if isinstance(target, str):
+            serverReader, serverWriter = await asyncio.open_unix_connection(target)
+        else:
+            serverReader, serverWriter = await asyncio.open_connection(*target)
+        await asyncio.gather(pipe(clientReader, serverWriter, 0),
+                             pipe(serverReader, clientWriter, latency))
+
+    loop.run_until_complete(asyncio.start_server(handle, '127.0.0.1', port))
+    loop.run_forever()
+
+
+def start_proxy(url, port, latency):
+    """Start a delaying proxy to the database at url and return (process, proxied url)."""
+    from sqlalchemy.engine import make_url
+
+    url = make_url(url)
+    query = dict(url.query)
+    socketDir = query.pop('host', None)
+    if socketDir or not url.host:
+        target = os.path.join(socketDir or '/var/run/postgresql', '.s.PGSQL.%d' % (url.port or 5432))
+    else:
+        target = (url.host, url.port or 5432)
+    process = multiprocessing.Process(target=_proxy, args=(port, target, latency / 1000), daemon=True)
+    process.start()
+    proxied = url.set(host='127.0.0.1', port=port, query=query)
+    return process, proxied.render_as_string(hide_password=False)
+
+
+def urls(postIds, merchantPosts, userIds):
+    while True:
+        kind = random.random()
+        if kind < 0.4:
+            merchantId, postId = random.choice(merchantPosts)
+            yield '/merchant/%d/post/%d' % (merchantId, postId)
+        elif kind < 0.6:
+            yield '/posts?ids=' + ','.join(str(i) for i in random.sample(postIds, min(20, len(postIds))))
+        elif kind < 0.9:
+            yield '/user/%d/discover?limit=20' % random.choice(userIds)
+        else:
+            yield '/user/%d/discover?limit=20&order=ranked' % random.choice(userIds)
+
+
+async def drive(base, paths, concurrency, duration):
+    latencies = []
+    errors = 0
+    deadline = time.monotonic() + duration
+
+    async def client(session):
+        nonlocal errors
+        while time.monotonic() < deadline:
+            started = time.monotonic()
+            try:
+                async with session.get(base + next(paths)) as response:
+                    await response.read()
+                    if response.status != 200:
+                        errors += 1
+            except aiohttp.ClientError:
+                errors += 1
+            latencies.append(time.monotonic() - started)
+
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        started = time.monotonic()
+        await asyncio.gather(*[client(session) for _ in range(concurrency)])
+        elapsed = time.monotonic() - started
+    latencies.sort()
+    return len(latencies) / elapsed, latencies, errors
+
+
+def wait_ready(base, process):
+    async def ping():
+        async with aiohttp.ClientSession() as session:
+            async with session.get(base + '/api/swagger.json') as response:
+                return response.status == 200
+    for _ in range(100):
+        if process.poll() is not None:
+            raise SystemExit('server exited with %d' % process.returncode)
+        try:
+            if asyncio.run(ping()):
+                return
+        except aiohttp.ClientError:
+            pass
+        time.sleep(0.2)
+    raise SystemExit('server did not start')
+
+
+def percentile(latencies, p):
+    return latencies[min(len(latencies) - 1, int(len(latencies) * p))]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--threads', type=int, default=1,
+                        help='gunicorn threads per worker in sync mode')
+    parser.add_argument('--concurrency', type=int, default=200)
+    parser.add_argument('--duration', type=float, default=20)
+    parser.add_argument('--port', type=int, default=8100)
+    parser.add_argument('--db-latency', type=float, default=0,
+                        help='milliseconds added to every database reply')
+    args = parser.parse_args()
+
+    if args.seed:
+        postIds, merchantPosts, userIds = seed(args.seed)
+    else:
+        postIds, merchantPosts, userIds = existing()
+    if not postIds:
+        raise SystemExit('no posts; run with --seed')
+
+    env = dict(os.environ)
+    if args.db_latency:
+        proxy, env['DATABASE_URL'] = start_proxy(os.environ['DATABASE_URL'], args.port + 1, args.db_latency)
+    bind = '127.0.0.1:%d' % args.port
+    modes = [('sync gunicorn', ['gunicorn', 'app:app', '--bind', bind, '--workers', str(args.workers),
+                                '--threads', str(args.threads), '--backlog', '2048']),
+             ('async hypercorn', ['hypercorn', 'async_app:app', '--bind', bind, '--workers', str(args.workers),
+                                  '--worker-class', 'asyncio', '--backlog', '2048'])]
+    print('%-16s %10s %9s %9s %9s %7s' % ('mode', 'requests/s', 'p50 ms', 'p99 ms', 'max ms', 'errors'))
+    for name, command in modes:
+        process = subprocess.Popen(command, cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            base = 'http://' + bind
+            wait_ready(base, process)
+            paths = urls(postIds, merchantPosts, userIds)
+            asyncio.run(drive(base, paths, args.concurrency, min(3, args.duration)))
+            rate, latencies, errors = asyncio.run(drive(base, paths, args.concurrency, args.duration))
+        finally:
+            process.terminate()
+            process.wait()
+        print('%-16s %10.0f %9.1f %9.1f %9.1f %7d' % (name, rate, percentile(latencies, 0.5) * 1000,
+                                                    percentile(latencies, 0.99) * 1000, latencies[-1] * 1000, errors))
+
+
+if __name__ == '__main__':
+    main()
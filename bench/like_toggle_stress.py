@@ -0,0 +1,82 @@
+"""Fire concurrent like toggles at one post and check the counts stay exact.
+
+Run against a scratch database that has been migrated to head:
+
+    DATABASE_URL=... python bench/like_toggle_stress.py --toggles 5000 --threads 32
+
+Every toggle goes through the POST /post/<id>/like view; set
+LIKE_WRITE_BEHIND=true to exercise the write-behind buffer. Afterwards
+Post.like_count, the feed entry's like_count and the number of like rows
+must all agree, and each user must have at most one like.
+"""
+import argparse
+import os
+import random
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import func  # noqa: E402
+
+from app import app  # noqa: E402
+from db import db  # noqa: E402
+import feed  # noqa: E402
+from likebuffer import like_buffer  # noqa: E402
+from models import Media, Merchant, User, Post, Like, FeedEntry  # noqa: E402
+
+
+def setup(users):
+    with app.app_context():
+        media = Media(uuid='stress', name='stress.jpg', mimetype='image/jpeg')
+        db.session.add(media)
+        db.session.flush()
+        merchant = Merchant(name='stress-%d' % random.getrandbits(32), logo_id=media.id)
+        db.session.add(merchant)
+        db.session.flush()
+        post = Post(media_id=media.id, user_id=merchant.id, title='stress')
+        db.session.add(post)
+        userIds = []
+        for i in range(users):
+            user = User(name='stress%d' % i, media_id=media.id)
+            db.session.add(user)
+            db.session.flush()
+            userIds.append(user.id)
+        db.session.flush()
+        feed.refresh_posts([post.id])
+        db.session.commit()
+        return post.id, userIds
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--toggles', type=int, default=5000)
+    parser.add_argument('--threads', type=int, default=32)
+    parser.add_argument('--users', type=int, default=50)
+    args = parser.parse_args()
+
+    postId, userIds = setup(args.users)
+    client = app.test_client()
+
+    def toggle(_):
+        r = client.post('/post/%d/like' % postId, json={'user_id': random.choice(userIds)})
+        return r.status_code
+
+    with ThreadPoolExecutor(max_workers=args.threads) as pool:
+        statuses = list(pool.map(toggle, range(args.toggles)))
+    like_buffer.stop()
+
+    with app.app_context():
+        likeRows = Like.query.filter_by(post_id=postId).count()
+        distinctUsers = db.session.query(func.count(func.distinct(Like.user_id))).filter_by(post_id=postId).scalar()
+        likeCount = db.session.query(Post.like_count).filter_by(id=postId).scalar()
+        feedCount = db.session.query(FeedEntry.like_count).filter_by(post_id=postId).scalar()
+    failed = len([s for s in statuses if s != 200])
+    print('toggles=%d failed=%d like_rows=%d distinct_users=%d post.like_count=%d feed_entry.like_count=%d' % (
+        args.toggles, failed, likeRows, distinctUsers, likeCount, feedCount))
+    if failed or not likeRows == distinctUsers == likeCount == feedCount:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
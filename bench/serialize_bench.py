@@ -0,0 +1,73 @@
+"""Compare response encoding paths on discover pages of synthetic posts.
+
+    python bench/serialize_bench.py --posts 1000 --rounds 50
+
+Times Flask's jsonify, which the views used before, against the compiled
+dto.py encoders on orjson and on the stdlib fallback. Needs no database.
+"""
+import argparse
+import os
+import sys
+import timeit
+
+os.environ.setdefault('DATABASE_URL', 'postgresql://localhost/bench')
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import jsonify  # noqa: E402
+
+from app import app  # noqa: E402
+import serialize  # noqa: E402
+from dto import ListDiscoverResponseSchema  # noqa: E402
+
+
+def item(i):
+    return {'id': i, 'name': 'Item %d' % i, 'media_url': 'https://cdn.example.com/%d/item.jpg' % i,
+            'media_thumbnail_url': 'https://cdn.example.com/%d/thumbnail/item.jpg' % i,
+            'media_mimetype': 'image/jpeg', 'currency': 'SGD', 'price': 1250, 'description': 'Grilled, with rice and sambal'}
+
+
+def post(i):
+    return {'items': [item(i * 3 + k) for k in range(3)], 'id': i, 'title': 'Lunch special number %d' % i,
+            'media_url': 'https://cdn.example.com/%d/post.jpg' % i, 'media_feed_url': 'https://cdn.example.com/%d/feed/post.jpg' % i,
+            'date_posted': '2021-10-18T12:00:00.%06d' % i, 'merchant_name': 'Merchant %d' % (i % 50),
+            'logo_url': 'https://cdn.example.com/logo/%d.png' % (i % 50), 'logo_mimetype': 'image/png',
+            'media_mimetype': 'image/jpeg', 'merchant_id': i % 50, 'is_boosted': i % 7 == 0,
+            'likes': i * 13 % 997, 'comments': i % 31, 'is_liked': i % 2 == 0}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--posts', type=int, default=1000)
+    parser.add_argument('--rounds', type=int, default=50)
+    args = parser.parse_args()
+
+    payload = {'posts': [post(i) for i in range(args.posts)], 'next_cursor': None}
+    backend = serialize.orjson
+
+    def flask_json():
+        with app.app_context():
+            return jsonify(payload).get_data()
+
+    def compiled():
+        return serialize.encode(ListDiscoverResponseSchema, payload)
+
+    def compiled_stdlib():
+        serialize.orjson = None
+        try:
+            return serialize.encode(ListDiscoverResponseSchema, payload)
+        finally:
+            serialize.orjson = backend
+
+    paths = [('flask jsonify', flask_json), ('compiled + stdlib json', compiled_stdlib)]
+    if backend is not None:
+        paths.append(('compiled + orjson', compiled))
+    baseline = None
+    for name, fn in paths:
+        size = len(fn())
+        seconds = min(timeit.repeat(fn, number=args.rounds, repeat=3)) / args.rounds
+        baseline = baseline or seconds
+        print('%-24s %8.2f ms/page %8d bytes %6.1fx' % (name, seconds * 1000, size, baseline / seconds))
+
+
+if __name__ == '__main__':
+    main()
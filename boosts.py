@@ -0,0 +1,98 @@
+import datetime
+import heapq
+import os
+import threading
+
+from sqlalchemy import func
+
+from db import db
+from models import Boost
+
+SYNC_INTERVAL = float(os.getenv('BOOST_SYNC_INTERVAL', 5))
+
+
+class BoostIndex(object):
+    """In-memory map of post_id to the end time of its active boost.
+
+    The map is loaded lazily, updated in place by boost_post, pruned as
+    boosts expire and reloaded whenever the boost table's version (row
+    count and max id) moves, which is how boosts created by other workers
+    become visible.
+    """
+
+    def __init__(self):
+        self._ends = {}
+        self._expiry = []
+        self._lock = threading.Lock()
+        self._version = None
+        self._thread = None
+
+    def _db_version(self):
+        return tuple(db.session.query(func.count(Boost.id), func.max(Boost.id)).one())
+
+    def load(self):
+        version = self._db_version()
+        currentTime = datetime.datetime.utcnow()
+        ends = dict(db.session.query(Boost.post_id, func.max(Boost.end_time)).filter(
+            Boost.end_time > currentTime).group_by(Boost.post_id))
+        with self._lock:
+            self._ends = ends
+            self._expiry = [(end, post_id) for post_id, end in ends.items()]
+            heapq.heapify(self._expiry)
+            self._version = version
+
+    def _ensure_loaded(self):
+        if self._version is None:
+            self.load()
+
+    def add(self, post_id, end_time):
+        self._ensure_loaded()
+        with self._lock:
+            current = self._ends.get(post_id)
+            if current is None or end_time > current:
+                self._ends[post_id] = end_time
+                heapq.heappush(self._expiry, (end_time, post_id))
+
+    def end_time(self, post_id):
+        self._ensure_loaded()
+        return self._ends.get(post_id)
+
+    def is_boosted(self, post_id, now=None):
+        end = self.end_time(post_id)
+        return end is not None and end > (now or datetime.datetime.utcnow())
+
+    def expire(self, now=None):
+        now = now or datetime.datetime.utcnow()
+        with self._lock:
+            while self._expiry and self._expiry[0][0] <= now:
+                end, post_id = heapq.heappop(self._expiry)
+                if self._ends.get(post_id) == end:
+                    del self._ends[post_id]
+
+    def sync(self):
+        if self._db_version() != self._version:
+            self.load()
+
+    def _run(self, app, interval):
+        stopped = threading.Event()
+        while not stopped.wait(interval):
+            with app.app_context():
+                try:
+                    self.expire()
+                    self.sync()
+                except Exception:
+                    app.logger.exception('boost index sync failed')
+                finally:
+                    db.session.remove()
+
+    def start(self, app, interval=SYNC_INTERVAL):
+        """Load the index and start the background expiry/sync thread."""
+        if self._thread is not None:
+            return
+        self.load()
+        self._thread = threading.Thread(
+            target=self._run, args=(app, interval), name='boost-index', daemon=True)
+        self._thread.start()
+
+
+boost_index = BoostIndex()
@@ -0,0 +1,140 @@
+import codecs
+import csv
+import json
+import os
+
+from marshmallow import ValidationError
+from sqlalchemy import insert
+
+from db import db
+from media import active_ids
+
+BULK_CHUNK_SIZE = int(os.getenv('BULK_CHUNK_SIZE', 1000))
+BULK_MAX_ROWS = int(os.getenv('BULK_MAX_ROWS', 50000))
+
+NDJSON_TYPES = ('application/x-ndjson', 'application/ndjson', 'application/jsonl')
+
+
+class UnsupportedFormat(ValueError):
+    pass
+
+
+class TooManyRows(ValueError):
+    pass
+
+
+def _json_rows(stream):
+    try:
+        rows = json.load(codecs.getreader('utf-8-sig')(stream))
+    except ValueError:
+        raise UnsupportedFormat('body is not valid JSON')
+    if not isinstance(rows, list):
+        raise UnsupportedFormat('expected a JSON array')
+    for row in rows:
+        yield row, None
+
+
+def _ndjson_rows(stream):
+    try:
+        for line in codecs.iterdecode(stream, 'utf-8-sig'):
+            if not line.strip():
+                continue
+            try:
+                yield json.loads(line), None
+            except ValueError:
+                yield None, {'_schema': ['invalid JSON']}
+    except UnicodeDecodeError:
+        raise UnsupportedFormat('body is not UTF-8')
+
+
+def _csv_rows(stream, list_fields):
+    try:
+        for row in csv.DictReader(codecs.iterdecode(stream, 'utf-8-sig')):
+            row = {k: v for k, v in row.items() if k is not None and v not in ('', None)}
+            for field in list_fields:
+                if field in row:
+                    row[field] = [v.strip() for v in row[field].split(';') if v.strip()]
+            yield row, None
+    except (UnicodeDecodeError, csv.Error):
+        raise UnsupportedFormat('body is not UTF-8 CSV')
+
+
+def read_rows(request, list_fields=()):
+    """Yield (row, errors) pairs from a bulk request, one row at a time.
+
+    The body may be a JSON array, NDJSON or CSV, sent as is or uploaded
+    as the 'file' part of a multipart form. In CSV, list_fields hold
+    values separated by ';'. errors is set for rows that could not be
+    parsed.
+    """
+    if request.mimetype == 'multipart/form-data':
+        upload = request.files.get('file')
+        if upload is None:
+            raise UnsupportedFormat('missing file')
+        mimetype = upload.mimetype
+        extension = os.path.splitext(upload.filename or '')[1].lower()
+        if extension == '.csv':
+            mimetype = 'text/csv'
+        elif extension in ('.ndjson', '.jsonl'):
+            mimetype = 'application/x-ndjson'
+        elif extension == '.json':
+            mimetype = 'application/json'
+        stream = upload.stream
+    else:
+        mimetype = request.mimetype
+        stream = request.stream
+    if mimetype == 'application/json':
+        return _json_rows(stream)
+    if mimetype in NDJSON_TYPES:
+        return _ndjson_rows(stream)
+    if mimetype == 'text/csv':
+        return _csv_rows(stream, list_fields)
+    raise UnsupportedFormat('unsupported content type %s' % mimetype)
+
+
+def _insert(model, chunk, results, ids):
+    known = active_ids(values['media_id'] for _, values in chunk)
+    valid = []
+    for n, values in chunk:
+        if values['media_id'] in known:
+            valid.append((n, values))
+        else:
+            results.append({'row': n, 'errors': {'media_id': ['unknown or unconfirmed media']}})
+    if not valid:
+        return
+    newIds = [row[0] for row in db.session.execute(
+        insert(model).values([values for _, values in valid]).returning(model.id))]
+    for (n, _), id in zip(valid, newIds):
+        results.append({'row': n, 'id': id})
+        ids.append(id)
+
+
+def import_rows(rows, schema, model, build, chunk_size=BULK_CHUNK_SIZE, max_rows=BULK_MAX_ROWS):
+    """Validate rows against schema and insert the valid ones into model.
+
+    Rows are validated as they are read, and valid rows are inserted
+    chunk_size at a time with a multi-row INSERT ... RETURNING. build turns
+    a loaded row into column values. Nothing is committed here. Returns
+    (results, ids), where results has one {'row', 'id'} or {'row',
+    'errors'} entry per row in row order. Raises TooManyRows past max_rows.
+    """
+    results = []
+    ids = []
+    chunk = []
+    for n, (row, errors) in enumerate(rows):
+        if n >= max_rows:
+            raise TooManyRows(max_rows)
+        if errors is None:
+            try:
+                chunk.append((n, build(schema.load(row))))
+            except ValidationError as e:
+                errors = e.messages
+        if errors:
+            results.append({'row': n, 'errors': errors})
+        if len(chunk) >= chunk_size:
+            _insert(model, chunk, results, ids)
+            chunk = []
+    if chunk:
+        _insert(model, chunk, results, ids)
+    results.sort(key=lambda result: result['row'])
+    return results, ids
@@ -0,0 +1,86 @@
+import collections
+import json
+import os
+import threading
+import time
+
+
+class LRUCache(object):
+    """A thread-safe, process-local LRU map with an optional per-entry TTL."""
+
+    def __init__(self, maxsize, ttl=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return default
+            value, expires = entry
+            if expires is not None and expires <= time.monotonic():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        expires = None if self.ttl is None else time.monotonic() + self.ttl
+        with self._lock:
+            self._data[key] = (value, expires)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class RedisCache(object):
+    """LRUCache-compatible cache stored in Redis (or any client with the
+    same get/set/delete API, such as fakeredis). Values are JSON encoded.
+    """
+
+    def __init__(self, client, ttl=None, prefix='grab-discover:'):
+        self.client = client
+        self.ttl = ttl
+        self.prefix = prefix
+
+    def get(self, key, default=None):
+        raw = self.client.get(self.prefix + str(key))
+        if raw is None:
+            return default
+        return json.loads(raw)
+
+    def set(self, key, value):
+        self.client.set(self.prefix + str(key), json.dumps(value), ex=self.ttl)
+
+    def delete(self, key):
+        self.client.delete(self.prefix + str(key))
+
+    def clear(self):
+        for key in self.client.scan_iter(match=self.prefix + '*'):
+            self.client.delete(key)
+
+
+def make_cache(url, maxsize, ttl=None):
+    """Return a RedisCache for a redis:// url, otherwise an LRUCache."""
+    if not url:
+        return LRUCache(maxsize=maxsize, ttl=ttl)
+    import redis
+    return RedisCache(redis.Redis.from_url(url), ttl=ttl)
+
+
+response_cache = make_cache(os.getenv('CACHE_URL'),
+                            maxsize=int(os.getenv('RESPONSE_CACHE_SIZE', 10000)),
+                            ttl=int(os.getenv('RESPONSE_CACHE_TTL', 300)))
@@ -0,0 +1,149 @@
+import os
+
+from sqlalchemy import select
+from sqlalchemy.orm import aliased
+
+from cache import LRUCache, response_cache
+from db import db
+from media import media_urls
+from models import Merchant, Media, Item
+
+item_cache = LRUCache(maxsize=int(os.getenv('ITEM_CACHE_SIZE', 10000)),
+                      ttl=int(os.getenv('ITEM_CACHE_TTL', 300)))
+
+
+def _item_record(item, media_item):
+    return {'id': item.id, 'name': item.name, 'media_mimetype': media_item.mimetype, 'media_key': media_item.key,
+            'media_thumbnail_key': media_item.rendition_key('thumbnail'),
+            'price': item.price, 'currency': item.currency, 'description': item.description}
+
+
+def cached_item_records(item_ids, merchant_versions):
+    """Return ({item_id: record} from the item cache, [ids not cached]).
+
+    Each worker has its own cache, so a cached record is only used while
+    the merchant that owns the item is still at the version the record
+    was loaded with; merchant_versions maps merchant ids to their current
+    versions. Every item write bumps its merchant's version.
+    """
+    found = {}
+    missing = []
+    for id in set(item_ids):
+        entry = item_cache.get(id)
+        if entry is None or merchant_versions.get(entry[0]) != entry[1]:
+            missing.append(id)
+        else:
+            found[id] = entry[2]
+    return found, missing
+
+
+def item_rows(item_ids):
+    """Select (item, media, merchant version) rows for item_ids."""
+    return select(Item, Media, Merchant.version).join(Media, Media.id == Item.media_id).join(
+        Merchant, Merchant.id == Item.merchant_id).where(Item.id.in_(item_ids))
+
+
+def store_item_records(rows):
+    """Cache the records of item_rows rows and return them keyed by item id."""
+    found = {}
+    for item, media_item, version in rows:
+        record = _item_record(item, media_item)
+        item_cache.set(item.id, (item.merchant_id, version, record))
+        found[item.id] = record
+    return found
+
+
+def resolve_item_records(item_ids, merchant_versions):
+    """Return cached item records for item_ids, keyed by item id.
+
+    A record is a GetItemResponseSchema dict carrying the media object keys
+    (media_key, media_thumbnail_key) in place of their URLs. Cache misses,
+    and records of items whose merchant is not in merchant_versions, are
+    loaded with one IN query. Ids that do not exist are left out.
+    """
+    found, missing = cached_item_records(item_ids, merchant_versions)
+    if missing:
+        found.update(store_item_records(db.session.execute(item_rows(missing))))
+    return found
+
+
+def item_payload(record):
+    payload = dict(record)
+    payload['media_url'] = media_urls.url_for_key(payload.pop('media_key'))
+    payload['media_thumbnail_url'] = media_urls.url_for_key(
+        payload.pop('media_thumbnail_key'))
+    return payload
+
+
+def merchant_record(merchant_id, version):
+    """Return the cached name and logo of a merchant, or None if it does not exist.
+
+    Records are cached under the merchant's version, so a write made
+    through another worker is never answered from this worker's cache.
+    """
+    key = 'merchant:%d:%d' % (merchant_id, version)
+    record = response_cache.get(key)
+    if record is None:
+        row = db.session.query(Merchant, Media).join(Media, Media.id == Merchant.logo_id).filter(
+            Merchant.id == merchant_id).first()
+        if row is None:
+            return None
+        merchant, logo = row
+        record = {'id': merchant.id, 'name': merchant.name,
+                  'logo_key': logo.key, 'logo_mimetype': logo.mimetype}
+        response_cache.set(key, record)
+    return record
+
+
+def item_version(merchant_id, item_id):
+    """Return the version of the merchant that owns item_id.
+
+    None if either the merchant merchant_id or the item does not exist.
+    """
+    owner = aliased(Merchant)
+    itemVersion = db.session.query(owner.version).join(Item, Item.merchant_id == owner.id).filter(
+        Item.id == item_id).scalar_subquery()
+    row = db.session.query(itemVersion).filter(Merchant.id == merchant_id).first()
+    return None if row is None else row[0]
+
+
+def item_record(item_id, version):
+    """Return the cached record of one item, or None if it does not exist.
+
+    version is that of the merchant owning the item (see item_version).
+    """
+    key = 'item:%d:%d' % (item_id, version)
+    record = response_cache.get(key)
+    if record is None:
+        row = db.session.query(Item, Media).join(
+            Media, Media.id == Item.media_id).filter(Item.id == item_id).first()
+        if row is None:
+            return None
+        record = _item_record(*row)
+        response_cache.set(key, record)
+    return record
+
+
+def menu_query(merchant_id):
+    """Query (item, media) rows of a merchant's menu, ordered by name."""
+    return db.session.query(Item, Media).join(Media, Media.id == Item.media_id).filter(
+        Item.merchant_id == merchant_id).order_by(Item.name, Item.id)
+
+
+def menu_payloads(rows):
+    return [item_payload(_item_record(item, media_item)) for item, media_item in rows]
+
+
+def menu_records(merchant_id, version):
+    """Return the cached item records of a merchant's menu, ordered by name."""
+    key = 'menu:%d:%d' % (merchant_id, version)
+    records = response_cache.get(key)
+    if records is None:
+        records = [_item_record(item, media_item)
+                   for item, media_item in menu_query(merchant_id)]
+        response_cache.set(key, records)
+    return records
+
+
+def invalidate_item(item_id):
+    item_cache.delete(item_id)
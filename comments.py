@@ -0,0 +1,73 @@
+import os
+
+from sqlalchemy import tuple_
+
+from cache import LRUCache
+from db import db
+from media import media_urls
+from models import Comment, Media, User
+from pagination import encode_cursor, decode_cursor
+
+profile_cache = LRUCache(maxsize=int(os.getenv('PROFILE_CACHE_SIZE', 10000)),
+                         ttl=int(os.getenv('PROFILE_CACHE_TTL', 300)))
+
+
+def profile_cards(user_versions):
+    """Return {user_id: profile card} for (user_id, version) pairs.
+
+    A card holds the user's name and the object key and mimetype of their
+    profile picture. Cards are cached under the user's version, which
+    update_user moves, so a profile edit made through another worker is
+    never answered from this worker's cache. Cache misses are loaded with
+    one joined User/Media IN query. Ids that do not exist are left out.
+    """
+    found = {}
+    missing = []
+    for id, version in set(user_versions):
+        card = profile_cache.get((id, version))
+        if card is None:
+            missing.append(id)
+        else:
+            found[id] = card
+    if not missing:
+        return found
+    for user, profile in db.session.query(User, Media).join(
+            Media, Media.id == User.media_id).filter(User.id.in_(missing)):
+        card = {'name': user.name, 'profile_key': profile.key,
+                'profile_mimetype': profile.mimetype}
+        profile_cache.set((user.id, user.version), card)
+        found[user.id] = card
+    return found
+
+
+def comment_query(post_id, cursor=None):
+    """Query (comment, author version) rows of a post oldest first, starting after cursor."""
+    query = db.session.query(Comment, User.version).join(User, User.id == Comment.user_id).filter(
+        Comment.post_id == post_id).order_by(Comment.date_posted, Comment.id)
+    if cursor:
+        date_posted, comment_id = decode_cursor(cursor)
+        query = query.filter(tuple_(Comment.date_posted, Comment.id)
+                             > tuple_(date_posted, comment_id))
+    return query
+
+
+def comment_page(post_id, limit, cursor=None):
+    """Return (rows, next_cursor) for an oldest-first page of a post's comments."""
+    rows = comment_query(post_id, cursor).limit(limit + 1).all()
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    last = rows[-1][0]
+    return rows, encode_cursor(last.date_posted, last.id)
+
+
+def comment_payloads(rows):
+    cards = profile_cards((comment.user_id, version) for comment, version in rows)
+    response = []
+    for comment, version in rows:
+        card = cards.get(comment.user_id)
+        if card is None:
+            continue
+        response.append({'id': comment.id, 'user_name': card['name'], 'profile_url': media_urls.url_for_key(card['profile_key']),
+                         'profile_mimetype': card['profile_mimetype'], 'content': comment.content, 'date_posted': comment.date_posted.isoformat()})
+    return response
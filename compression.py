@@ -0,0 +1,90 @@
+import gzip
+import os
+import time
+
+from flask import request
+
+import metrics
+from cache import LRUCache
+from conditional import ENCODING_TAG_SUFFIXES
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+MIN_SIZE = int(os.getenv('COMPRESSION_MIN_SIZE', 1024))
+GZIP_LEVEL = int(os.getenv('COMPRESSION_GZIP_LEVEL', 6))
+BROTLI_QUALITY = int(os.getenv('COMPRESSION_BROTLI_QUALITY', 5))
+COMPRESSIBLE_TYPES = ('application/json', 'text/')
+RATIO_BUCKETS = (0.05, 0.1, 0.15, 0.2, 0.3, 0.4, 0.5, 0.6, 0.8, 1.0)
+
+precompressed = LRUCache(maxsize=int(
+    os.getenv('COMPRESSION_CACHE_SIZE', 1000)))
+
+
+def _compress(data, encoding):
+    if encoding == 'br':
+        return brotli.compress(data, quality=BROTLI_QUALITY)
+    return gzip.compress(data, compresslevel=GZIP_LEVEL)
+
+
+def negotiate(response, accept_encodings):
+    """Return the encoding to compress response with, or None to leave it be.
+
+    Marks compressible responses as varying on Accept-Encoding whether or
+    not they end up compressed.
+    """
+    if getattr(response, 'direct_passthrough', False) or getattr(response, 'is_streamed', False):
+        return None
+    if not response.mimetype.startswith(COMPRESSIBLE_TYPES):
+        return None
+    response.vary.add('Accept-Encoding')
+    if response.status_code != 200 or 'Content-Encoding' in response.headers:
+        return None
+    if response.content_length is None or response.content_length < MIN_SIZE:
+        return None
+    if brotli is not None and accept_encodings['br']:
+        return 'br'
+    if accept_encodings['gzip']:
+        return 'gzip'
+    return None
+
+
+def compress_body(response, encoding, path, data):
+    """Replace the body of response, data, with its encoding-compressed form.
+
+    Bodies of responses that carry an ETag are kept compressed in a
+    bounded cache keyed by path, ETag and encoding, so hot payloads are
+    compressed once. The ETag of a compressed body gets an encoding suffix
+    to stay a strong validator.
+    """
+    etag, weak = response.get_etag()
+    key = (path, etag, encoding) if etag and not weak else None
+    body = precompressed.get(key) if key else None
+    if body is not None:
+        metrics.counter('compression.%s.cache_hits' % encoding).inc()
+    else:
+        started = time.process_time()
+        body = _compress(data, encoding)
+        metrics.histogram('compression.%s.cpu_seconds' %
+                          encoding).observe(time.process_time() - started)
+        metrics.histogram('compression.%s.ratio' % encoding,
+                          RATIO_BUCKETS).observe(len(body) / len(data))
+        metrics.counter('compression.%s.bytes_in' % encoding).inc(len(data))
+        metrics.counter('compression.%s.bytes_out' % encoding).inc(len(body))
+        if key:
+            precompressed.set(key, body)
+    response.set_data(body)
+    response.headers['Content-Encoding'] = encoding
+    if etag and not weak:
+        response.set_etag(etag + ENCODING_TAG_SUFFIXES[encoding])
+    return response
+
+
+def compress_response(response):
+    """Compress a response body with the best encoding the client accepts."""
+    encoding = negotiate(response, request.accept_encodings)
+    if encoding is None:
+        return response
+    return compress_body(response, encoding, request.path, response.get_data())
@@ -0,0 +1,59 @@
+import zlib
+
+from flask import make_response, request
+
+from media import media_urls
+
+MENU_CACHE_CONTROL = 'public, max-age=30'
+POSTS_CACHE_CONTROL = 'public, max-age=10'
+POST_CACHE_CONTROL = 'public, max-age=10'
+COMMENTS_CACHE_CONTROL = 'public, max-age=5'
+SWAGGER_CACHE_CONTROL = 'public, max-age=300'
+ENCODING_TAG_SUFFIXES = {'gzip': '-gzip', 'br': '-br'}
+
+
+def make_etag(*parts, query_string=None):
+    """Build a strong ETag from version stamps and the request's query string.
+
+    With signed media URLs the tag also carries the signing epoch, so
+    neither a 304 nor the compressed body cache keeps handing out a body
+    whose signatures have expired.
+    """
+    if query_string is None:
+        query_string = request.query_string
+    epoch = media_urls.epoch()
+    if epoch is not None:
+        parts += ('s%d' % epoch,)
+    tag = '-'.join(str(part) for part in parts)
+    if query_string:
+        tag += '-%08x' % zlib.crc32(query_string)
+    return tag
+
+
+def matching_tag(tag, if_none_match):
+    """Return the variant of tag that If-None-Match holds, or None.
+
+    The variants are tag itself and tag with each content-encoding suffix.
+    """
+    for variant in [tag] + [tag + suffix for suffix in ENCODING_TAG_SUFFIXES.values()]:
+        if variant in if_none_match:
+            return variant
+    return None
+
+
+def conditional(tag, cache_control, build):
+    """Answer a GET with a strong ETag and a Cache-Control header.
+
+    Returns 304 without calling build() when If-None-Match already holds
+    tag, or tag with a content-encoding suffix; otherwise build() produces
+    the response as a view would.
+    """
+    variant = matching_tag(tag, request.if_none_match)
+    if variant is not None:
+        response = make_response('', 304)
+        response.set_etag(variant)
+    else:
+        response = make_response(build())
+        response.set_etag(tag)
+    response.headers['Cache-Control'] = cache_control
+    return response
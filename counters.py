@@ -0,0 +1,97 @@
+from sqlalchemy import text, update
+
+from db import db
+from models import Post
+
+
+def bump(column, post_id, delta):
+    """Atomically add delta to a Post counter column and return its new value.
+
+    The post's version stamp moves in the same statement.
+    """
+    return db.session.execute(update(Post).where(Post.id == post_id).values(
+        {column: column + delta, Post.version: Post.version + 1}).returning(column)).scalar()
+
+
+TOGGLE_LIKE = text('''
+WITH removed AS (
+    DELETE FROM "like" WHERE post_id = :post_id AND user_id = :user_id
+    RETURNING id
+), added AS (
+    INSERT INTO "like" (user_id, post_id)
+    SELECT :user_id, :post_id WHERE NOT EXISTS (SELECT 1 FROM removed)
+    ON CONFLICT ON CONSTRAINT uq_like_post_id_user_id DO NOTHING
+    RETURNING id
+), counted AS (
+    UPDATE post
+    SET like_count = like_count + (SELECT count(*) FROM added) - (SELECT count(*) FROM removed),
+        version = version + 1
+    WHERE id = :post_id
+    RETURNING like_count
+), feed AS (
+    UPDATE feed_entry SET like_count = (SELECT like_count FROM counted)
+    WHERE post_id = :post_id
+), stamped AS (
+    UPDATE "user" SET likes_version = likes_version + 1
+    WHERE id = :user_id
+    RETURNING likes_version
+)
+SELECT (SELECT like_count FROM counted), NOT EXISTS (SELECT 1 FROM removed),
+       (SELECT likes_version FROM stamped)
+''')
+
+
+def toggle_like(post_id, user_id):
+    """Flip user_id's like on a post.
+
+    Returns (like_count, is_liked, likes_version). The like row,
+    Post.like_count, the post's version, its feed entry and the user's
+    likes_version all change in one statement. If a concurrent request inserted the same
+    like first, the insert is skipped and the like is reported as held.
+    Raises IntegrityError when the post or the user does not exist.
+    """
+    return tuple(db.session.execute(TOGGLE_LIKE, {'post_id': post_id, 'user_id': user_id}).first())
+
+
+def touch(model, *ids):
+    """Bump the version stamp of Merchant or Post rows."""
+    if ids:
+        db.session.execute(update(model).where(model.id.in_(ids)).values(
+            {model.version: model.version + 1}).execution_options(synchronize_session=False))
+
+
+RECONCILE = text('''
+WITH actual AS (
+    SELECT post.id,
+           (SELECT count(*) FROM "like" WHERE "like".post_id = post.id) AS like_count,
+           (SELECT count(*) FROM comment WHERE comment.post_id = post.id) AS comment_count
+    FROM post
+), fixed AS (
+    UPDATE post
+    SET like_count = actual.like_count, comment_count = actual.comment_count,
+        version = post.version + 1
+    FROM actual
+    WHERE post.id = actual.id
+      AND (post.like_count <> actual.like_count OR post.comment_count <> actual.comment_count)
+    RETURNING post.id
+), feed AS (
+    UPDATE feed_entry
+    SET like_count = actual.like_count, comment_count = actual.comment_count
+    FROM actual
+    WHERE feed_entry.post_id = actual.id
+      AND (feed_entry.like_count <> actual.like_count OR feed_entry.comment_count <> actual.comment_count)
+)
+SELECT count(*) FROM fixed
+''')
+
+
+def reconcile():
+    """Rebuild every post's like and comment counters from the source rows.
+
+    Posts whose counters change get a new version, and feed entries are
+    brought in line as well, in one statement. Returns how many posts
+    were corrected.
+    """
+    fixed = db.session.execute(RECONCILE).scalar()
+    db.session.commit()
+    return fixed
@@ -1,9 +1,18 @@
-from flask_sqlalchemy import SQLAlchemy
+from flask_sqlalchemy import SQLAlchemy as BaseSQLAlchemy
+from flask_migrate import Migrate
 
-db = SQLAlchemy()
+import pool
+
+
+class SQLAlchemy(BaseSQLAlchemy):
+    def create_engine(self, sa_url, engine_opts):
+        return pool.configure_engine(super(SQLAlchemy, self).create_engine(sa_url, engine_opts))
+
+
+db = SQLAlchemy(engine_options=pool.engine_options())
+migrate = Migrate()
 
 
 def db_init(app):
     db.init_app(app)
-    with app.app_context():
-        db.create_all()
+    migrate.init_app(app, db)
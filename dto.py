@@ -22,7 +22,7 @@ class UpdateMerchantSchema(Schema):
 
 class CreatePostRequestSchema(Schema):
     title = fields.Str()
-    media_id = fields.Int()
+    media_id = fields.Int(required=True)
     items = fields.List(fields.Int())
 
 
@@ -41,6 +41,18 @@ class UploadMediaResponseSchema(Schema):
     media_url = fields.Str()
 
 
+class CreateUploadRequestSchema(Schema):
+    filename = fields.Str()
+    content_type = fields.Str()
+    size = fields.Int()
+
+
+class CreateUploadResponseSchema(Schema):
+    id = fields.Int()
+    url = fields.Str()
+    fields = fields.Dict(keys=fields.Str(), values=fields.Str())
+
+
 class CreateUserSchema(Schema):
     profile_id = fields.Int()
     name = fields.Str()
@@ -56,17 +68,29 @@ class UpdateUserSchema(Schema):
 
 
 class CreateItemSchema(Schema):
-    name = fields.Str()
-    media_id = fields.Int()
+    name = fields.Str(required=True)
+    media_id = fields.Int(required=True)
     price = fields.Int()
     description = fields.Str()
-    currency = fields.Str()
+    currency = fields.Str(required=True)
 
 
 class CreateItemResponseSchema(Schema):
     id = fields.Int()
 
 
+class BulkImportResultSchema(Schema):
+    row = fields.Int()
+    id = fields.Int()
+    errors = fields.Dict()
+
+
+class BulkImportResponseSchema(Schema):
+    created = fields.Int()
+    failed = fields.Int()
+    results = fields.List(fields.Nested(BulkImportResultSchema))
+
+
 class UpdateItemSchema(Schema):
     name = fields.Str()
     media_id = fields.Int()
@@ -79,6 +103,7 @@ class GetItemResponseSchema(Schema):
     id = fields.Int()
     name = fields.Str()
     media_url = fields.Str()
+    media_thumbnail_url = fields.Str()
     media_mimetype = fields.Str()
     currency = fields.Str()
     price = fields.Int()
@@ -92,6 +117,7 @@ class ListMenuResponseSchema(Schema):
 class GetPostResponseSchema(Schema):
     id = fields.Int()
     media_url = fields.Str()
+    media_feed_url = fields.Str()
     media_mimetype = fields.Str()
     title = fields.Str()
     date_posted = fields.Str()
@@ -108,6 +134,11 @@ class ListPostResponsesSchema(Schema):
     posts = fields.List(fields.Nested(GetPostResponseSchema))
 
 
+class GetPostsResponseSchema(Schema):
+    posts = fields.List(fields.Nested(GetPostResponseSchema))
+    missing = fields.List(fields.Int())
+
+
 class GetDiscoverResponseSchema(Schema):
     id = fields.Int()
     merchant_name = fields.Str()
@@ -115,7 +146,9 @@ class GetDiscoverResponseSchema(Schema):
     logo_mimetype = fields.Str()
     title = fields.Str()
     media_url = fields.Str()
+    media_feed_url = fields.Str()
     media_mimetype = fields.Str()
+    date_posted = fields.Str()
     is_boosted = fields.Bool()
     orders = fields.Int()
     likes = fields.Int()
@@ -127,6 +160,7 @@ class GetDiscoverResponseSchema(Schema):
 
 class ListDiscoverResponseSchema(Schema):
     posts = fields.List(fields.Nested(GetDiscoverResponseSchema))
+    next_cursor = fields.Str(allow_none=True)
 
 
 class BoostRequestSchema(Schema):
@@ -162,3 +196,4 @@ class GetCommentsResponseSchema(Schema):
 
 class ListCommentsResponseSchema(Schema):
     comments = fields.List(fields.Nested(GetCommentsResponseSchema))
+    next_cursor = fields.Str(allow_none=True)
@@ -0,0 +1,45 @@
+import datetime
+
+from sqlalchemy import tuple_
+
+from db import db
+from models import Post, Like, Boost, Comment, Item, FeedEntry
+
+
+def hot_queries():
+    """The queries the request paths run most, keyed by a short name."""
+    now = datetime.datetime.utcnow()
+    return {
+        'merchant posts': Post.query.filter_by(user_id=1).order_by(Post.date_posted.desc()),
+        'posts by date': Post.query.order_by(Post.date_posted.desc()).limit(20),
+        'posts with item': db.session.query(Post.id).filter(Post.items.contains([1])),
+        'like lookup': Like.query.filter_by(post_id=1, user_id=1),
+        'liked posts': db.session.query(Like.post_id).filter_by(user_id=1).order_by(Like.post_id),
+        'active boost': Boost.query.filter(Boost.end_time > now).filter_by(post_id=1),
+        'comment page': Comment.query.filter_by(post_id=1).filter(tuple_(Comment.date_posted, Comment.id) > tuple_(now, 1)).order_by(Comment.date_posted, Comment.id).limit(21),
+        'menu': Item.query.filter_by(merchant_id=1).order_by(Item.name),
+        'feed page': FeedEntry.query.order_by(FeedEntry.date_posted.desc(), FeedEntry.post_id.desc()).limit(21),
+    }
+
+
+def explain(query):
+    compiled = query.statement.compile(dialect=db.engine.dialect)
+    return [row[0] for row in db.session.connection().exec_driver_sql('EXPLAIN ' + str(compiled), compiled.params)]
+
+
+def check_indexes():
+    """Return {name: plan} for the hot queries whose plan still has a sequential scan.
+
+    Sequential scans are disabled while planning, so a scan left in a plan
+    means no index can serve the query, whatever the table sizes are.
+    """
+    failures = {}
+    try:
+        db.session.execute('SET LOCAL enable_seqscan = off')
+        for name, query in hot_queries().items():
+            plan = explain(query)
+            if any('Seq Scan' in line for line in plan):
+                failures[name] = plan
+    finally:
+        db.session.rollback()
+    return failures
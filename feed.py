@@ -0,0 +1,180 @@
+import datetime
+import time
+
+from sqlalchemy import func, tuple_
+from sqlalchemy.dialects.postgresql import insert
+
+from db import db
+from models import Merchant, Media, Post, Item, Boost, FeedEntry
+from hydrate import load_page
+from media import media_urls
+from catalog import invalidate_item, item_payload
+from ranking import ranker
+from likes import liked_posts
+from likebuffer import like_buffer
+from pagination import encode_cursor, decode_cursor, encode_rank_cursor, decode_rank_cursor
+
+REBUILD_BATCH_SIZE = 500
+
+
+def _upsert(posts):
+    if not posts:
+        return
+    post_ids = [post.id for post in posts]
+    boosts = dict(db.session.query(Boost.post_id, func.max(Boost.end_time)).filter(
+        Boost.post_id.in_(post_ids)).group_by(Boost.post_id))
+    merchants, media, items = load_page(posts)
+    rows = []
+    for post in posts:
+        merchant, logo = merchants[post.user_id]
+        post_media = media[post.media_id]
+        rows.append({'post_id': post.id, 'merchant_id': post.user_id, 'date_posted': post.date_posted, 'title': post.title,
+                     'merchant_name': merchant.name, 'logo_id': logo.id, 'logo_key': logo.key, 'logo_mimetype': logo.mimetype,
+                     'media_id': post_media.id, 'media_key': post_media.key,
+                     'media_feed_key': post_media.rendition_key('feed'), 'media_mimetype': post_media.mimetype,
+                     'like_count': post.like_count, 'comment_count': post.comment_count, 'boost_end': boosts.get(post.id),
+                     'items': [items[i] for i in (post.items or []) if i in items]})
+    stmt = insert(FeedEntry).values(rows)
+    stmt = stmt.on_conflict_do_update(index_elements=[FeedEntry.post_id], set_={
+        name: stmt.excluded[name] for name in rows[0] if name != 'post_id'})
+    db.session.execute(stmt)
+
+
+def refresh_posts(post_ids):
+    """Rebuild the feed rows of the given posts in the current transaction."""
+    post_ids = list(post_ids)
+    if post_ids:
+        _upsert(Post.query.filter(Post.id.in_(post_ids)).all())
+
+
+def refresh_merchant(merchant_id):
+    merchant = Merchant.query.get(merchant_id)
+    logo = Media.query.get(merchant.logo_id)
+    FeedEntry.query.filter_by(merchant_id=merchant_id).update({'merchant_name': merchant.name, 'logo_id': logo.id, 'logo_key': logo.key, 'logo_mimetype': logo.mimetype}, synchronize_session=False)
+
+
+def refresh_item(item_id):
+    invalidate_item(item_id)
+    refresh_posts(row[0] for row in db.session.query(
+        Post.id).filter(Post.items.contains([item_id])))
+
+
+def refresh_media(media):
+    """Pick up new renditions of media in the rows and items that show it."""
+    FeedEntry.query.filter_by(media_id=media.id).update(
+        {'media_feed_key': media.rendition_key('feed')}, synchronize_session=False)
+    for row in db.session.query(Item.id).filter_by(media_id=media.id):
+        refresh_item(row[0])
+
+
+def remove_post(post_id):
+    FeedEntry.query.filter_by(post_id=post_id).delete(
+        synchronize_session=False)
+
+
+def set_counts(post_id, **counts):
+    FeedEntry.query.filter_by(post_id=post_id).update(
+        counts, synchronize_session=False)
+
+
+def set_boost(post_id, end_time):
+    FeedEntry.query.filter_by(post_id=post_id).update(
+        {'boost_end': func.greatest(func.coalesce(FeedEntry.boost_end, end_time), end_time)}, synchronize_session=False)
+
+
+def rebuild():
+    """Rebuild the whole feed table from the source tables."""
+    FeedEntry.query.delete(synchronize_session=False)
+    lastId = 0
+    total = 0
+    while True:
+        posts = Post.query.filter(Post.id > lastId).order_by(
+            Post.id).limit(REBUILD_BATCH_SIZE).all()
+        if not posts:
+            break
+        _upsert(posts)
+        db.session.commit()
+        lastId = posts[-1].id
+        total += len(posts)
+    return total
+
+
+def recent_criteria(cursor=None):
+    """Return (where clauses, order_by clauses) for feed rows newest first, after cursor."""
+    where = []
+    if cursor:
+        date_posted, post_id = decode_cursor(cursor)
+        where.append(tuple_(FeedEntry.date_posted, FeedEntry.post_id)
+                     < tuple_(date_posted, post_id))
+    return where, (FeedEntry.date_posted.desc(), FeedEntry.post_id.desc())
+
+
+def recent_query(cursor=None):
+    """Query feed rows newest first, starting after cursor."""
+    where, order = recent_criteria(cursor)
+    return FeedEntry.query.filter(*where).order_by(*order)
+
+
+def split_page(entries, limit):
+    """Return (entries, next_cursor) from up to limit + 1 newest-first feed rows."""
+    if len(entries) <= limit:
+        return entries, None
+    entries = entries[:limit]
+    return entries, encode_cursor(entries[-1].date_posted, entries[-1].post_id)
+
+
+def recent_page(limit, cursor=None):
+    """Return (entries, next_cursor) for a newest-first page of the feed."""
+    return split_page(recent_query(cursor).limit(limit + 1).all(), limit)
+
+
+def ranked_ids(limit, cursor=None):
+    """Return (post_ids, next_cursor) for a page of the feed in ranking order.
+
+    The cursor pins the time the first page was scored at, so later pages
+    continue the same ordering as long as the ranker's columns are not
+    reloaded in between (see RankingEngine.top).
+    """
+    after = None
+    if cursor:
+        now, score, post_id = decode_rank_cursor(cursor)
+        after = (score, post_id)
+    else:
+        now = time.time()
+    post_ids, scores = ranker.top(limit + 1, now, after)
+    nextCursor = None
+    if len(post_ids) > limit:
+        post_ids, scores = post_ids[:limit], scores[:limit]
+        nextCursor = encode_rank_cursor(now, scores[-1], post_ids[-1])
+    return post_ids, nextCursor
+
+
+def ranked_page(limit, cursor=None):
+    """Return (entries, next_cursor) for a page of the feed in ranking order."""
+    post_ids, nextCursor = ranked_ids(limit, cursor)
+    if not post_ids:
+        return [], nextCursor
+    entries = {entry.post_id: entry for entry in FeedEntry.query.filter(
+        FeedEntry.post_id.in_(post_ids))}
+    return [entries[i] for i in post_ids if i in entries], nextCursor
+
+
+def entry_payloads(entries, liked):
+    """Turn a page of feed rows into discover payloads, given the set of liked post ids."""
+    currentTime = datetime.datetime.utcnow()
+    return [{'items': [item_payload(record) for record in entry.items], 'id': entry.post_id, 'title': entry.title,
+             'media_url': media_urls.url_for_key(entry.media_key), 'media_feed_url': media_urls.url_for_key(entry.media_feed_key),
+             'date_posted': entry.date_posted.isoformat(),
+             'merchant_name': entry.merchant_name, 'logo_url': media_urls.url_for_key(entry.logo_key), 'logo_mimetype': entry.logo_mimetype,
+             'media_mimetype': entry.media_mimetype, 'merchant_id': entry.merchant_id,
+             'is_boosted': entry.boost_end is not None and entry.boost_end > currentTime,
+             'likes': like_buffer.like_count(entry.post_id, entry.like_count), 'comments': entry.comment_count, 'is_liked': entry.post_id in liked} for entry in entries]
+
+
+def discover_payloads(entries, user):
+    """Turn a page of feed rows into discover payloads for user."""
+    if not entries:
+        return []
+    liked = liked_posts.liked_among(
+        user.id, user.likes_version, [entry.post_id for entry in entries])
+    return entry_payloads(entries, liked)
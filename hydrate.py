@@ -0,0 +1,65 @@
+import datetime
+
+from db import db
+from models import Merchant, Media
+from media import media_urls
+from boosts import boost_index
+from likes import liked_posts
+from likebuffer import like_buffer
+from catalog import resolve_item_records, item_payload
+
+
+def load_page(posts):
+    """Load what a page of posts refers to in a fixed number of queries.
+
+    Returns ({merchant_id: (merchant, logo)}, {media_id: media},
+    {item_id: item record}).
+    """
+    merchants = {}
+    for merchant, logo in db.session.query(Merchant, Media).join(
+            Media, Media.id == Merchant.logo_id).filter(
+            Merchant.id.in_({post.user_id for post in posts})):
+        merchants[merchant.id] = (merchant, logo)
+    media = {m.id: m for m in Media.query.filter(
+        Media.id.in_({post.media_id for post in posts}))}
+    items = resolve_item_records(
+        [i for post in posts for i in (post.items or [])],
+        {id: merchant.version for id, (merchant, logo) in merchants.items()})
+    return merchants, media, items
+
+
+def post_payloads(posts, merchants, media, items, liked=None):
+    """Build the response payloads for posts from what load_page returned.
+
+    When liked, the set of post ids the requesting user has liked, is
+    given the payloads also carry merchant_id and is_liked, as the
+    discover feed expects.
+    """
+    currentTime = datetime.datetime.utcnow()
+    response = []
+    for post in posts:
+        merchant, logo = merchants[post.user_id]
+        post_media = media[post.media_id]
+        payload = {'items': [item_payload(items[i]) for i in (post.items or []) if i in items], 'id': post.id, 'title': post.title, 'media_url': media_urls.url(post_media), 'media_feed_url': media_urls.url_for_key(post_media.rendition_key('feed')), 'date_posted': post.date_posted.isoformat(), 'merchant_name': merchant.name, 'logo_url': media_urls.url(
+            logo), 'logo_mimetype': logo.mimetype, 'media_mimetype': post_media.mimetype, 'is_boosted': boost_index.is_boosted(post.id, currentTime), 'likes': like_buffer.like_count(post.id, post.like_count), 'comments': post.comment_count}
+        if liked is not None:
+            payload['merchant_id'] = merchant.id
+            payload['is_liked'] = post.id in liked
+        response.append(payload)
+    return response
+
+
+def hydrate_posts(posts, user=None):
+    """Build the response payloads for a page of posts.
+
+    Runs a fixed number of set-based queries however many posts are on the
+    page. When user is given the payloads also carry merchant_id and
+    is_liked, as the discover feed expects.
+    """
+    if not posts:
+        return []
+    merchants, media, items = load_page(posts)
+    liked = None
+    if user is not None:
+        liked = liked_posts.liked_among(user.id, user.likes_version, [post.id for post in posts])
+    return post_payloads(posts, merchants, media, items, liked)
@@ -0,0 +1,366 @@
+import atexit
+import glob
+import os
+import threading
+import time
+import zlib
+
+from sqlalchemy import text
+
+import metrics
+from db import db
+
+ENABLED = os.getenv('LIKE_WRITE_BEHIND', '').lower() in ('1', 'true', 'yes')
+FLUSH_INTERVAL = float(os.getenv('LIKE_FLUSH_INTERVAL_MS', 200)) / 1000
+FLUSH_EVENTS = int(os.getenv('LIKE_FLUSH_EVENTS', 500))
+JOURNAL_DIR = os.getenv('LIKE_JOURNAL_DIR', '/tmp/grab-discover-likes')
+JOURNAL_FSYNC = os.getenv('LIKE_JOURNAL_FSYNC', '').lower() in (
+    '1', 'true', 'yes')
+
+POST_STATE = text('''
+SELECT (SELECT like_count FROM post WHERE id = :post_id),
+       EXISTS (SELECT 1 FROM "user" WHERE id = :user_id),
+       EXISTS (SELECT 1 FROM "like" WHERE post_id = :post_id AND user_id = :user_id)
+''')
+
+FLUSH_LIKES = text('''
+WITH wanted AS (
+    SELECT w.user_id, w.post_id, w.liked
+    FROM unnest(CAST(:user_ids AS integer[]), CAST(:post_ids AS integer[]),
+                CAST(:liked AS boolean[])) AS w(user_id, post_id, liked)
+    WHERE EXISTS (SELECT 1 FROM post WHERE post.id = w.post_id)
+      AND EXISTS (SELECT 1 FROM "user" WHERE "user".id = w.user_id)
+), added AS (
+    INSERT INTO "like" (user_id, post_id)
+    SELECT user_id, post_id FROM wanted WHERE liked
+    ON CONFLICT ON CONSTRAINT uq_like_post_id_user_id DO NOTHING
+    RETURNING user_id, post_id
+), removed AS (
+    DELETE FROM "like" USING wanted
+    WHERE NOT wanted.liked AND "like".user_id = wanted.user_id AND "like".post_id = wanted.post_id
+    RETURNING "like".user_id, "like".post_id
+), delta AS (
+    SELECT post_id, sum(n) AS n FROM (
+        SELECT post_id, 1 AS n FROM added
+        UNION ALL
+        SELECT post_id, -1 AS n FROM removed) changes
+    GROUP BY post_id
+), counted AS (
+    UPDATE post SET like_count = post.like_count + delta.n, version = post.version + 1
+    FROM delta WHERE post.id = delta.post_id
+    RETURNING post.id, post.like_count
+), feed AS (
+    UPDATE feed_entry SET like_count = counted.like_count
+    FROM counted WHERE feed_entry.post_id = counted.id
+), stamped AS (
+    UPDATE "user" SET likes_version = likes_version + 1
+    WHERE id IN (SELECT user_id FROM added UNION SELECT user_id FROM removed)
+)
+SELECT id, like_count FROM counted
+''')
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class LikeBuffer(object):
+    """Write-behind buffer for like toggles on this worker.
+
+    A toggle records the state the like should end up in, keyed by
+    (post_id, user_id), so repeated taps coalesce into one row change.
+    Every toggle is appended to a journal segment before it is
+    acknowledged. A background thread writes the buffered states in one
+    statement every flush_interval seconds, or sooner once flush_events
+    are pending, and deletes the segments it covered.
+
+    Flushing applies states rather than deltas, so replaying a journal
+    is harmless. Journals left by a dead worker are replayed by the next
+    one that starts. Post.like_count moves by the rows the flush actually
+    inserted or deleted, so it stays exact whatever the buffer assumed.
+    """
+
+    def __init__(self, journal_dir=JOURNAL_DIR, flush_interval=FLUSH_INTERVAL,
+                 flush_events=FLUSH_EVENTS, fsync=JOURNAL_FSYNC):
+        self.journal_dir = journal_dir
+        self.flush_interval = flush_interval
+        self.flush_events = flush_events
+        self.fsync = fsync
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        # (post_id, user_id) -> [base, liked, buffered_at]
+        self._pending = {}
+        self._flushing = {}
+        # post_id -> [like_count, pending delta, buffered entries]
+        self._posts = {}
+        # bumped by every flush that reaches Postgres
+        self._flushes = 0
+        self._journal = None
+        self._segment = 0
+        self._closed = []
+        self._wake = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+        self._app = None
+        self._events = metrics.counter('likes.buffer.events')
+        self._flushed = metrics.counter('likes.buffer.flushed')
+        self._errors = metrics.counter('likes.buffer.flush_errors')
+        self._flush_seconds = metrics.histogram('likes.buffer.flush_seconds')
+        metrics.gauge('likes.buffer.pending', self.pending)
+        metrics.gauge('likes.buffer.lag_seconds', self.lag)
+
+    @property
+    def running(self):
+        return self._thread is not None
+
+    def pending(self):
+        with self._lock:
+            return len(self._pending) + len(self._flushing)
+
+    def lag(self):
+        """Age in seconds of the oldest buffered toggle not yet in Postgres."""
+        with self._lock:
+            oldest = min([entry[2] for entry in self._pending.values()]
+                         + [entry[2] for entry in self._flushing.values()], default=None)
+        return 0.0 if oldest is None else time.time() - oldest
+
+    def _segment_path(self, segment):
+        return os.path.join(self.journal_dir, 'likes-%d-%06d.journal' % (os.getpid(), segment))
+
+    def _open_segment(self):
+        self._segment += 1
+        self._journal = open(self._segment_path(self._segment), 'a')
+
+    def _close_segment(self):
+        if self._journal is not None:
+            self._journal.close()
+            self._closed.append(self._journal.name)
+            self._journal = None
+
+    def toggle(self, post_id, user_id):
+        """Buffer a like toggle and return (like_count, is_liked).
+
+        The count includes this worker's buffered toggles. Returns None
+        when the post or the user does not exist. Unless this worker
+        already buffers the (post, user) pair, its current state is read
+        from Postgres together with the checks, as the last toggle may
+        have gone through another worker.
+        """
+        key = (post_id, user_id)
+        with self._lock:
+            buffered = key in self._pending or key in self._flushing
+            flushes = self._flushes
+        storedCount = storedLiked = None
+        if not buffered:
+            storedCount, userExists, storedLiked = db.session.execute(
+                POST_STATE, {'post_id': post_id, 'user_id': user_id}).first()
+            if storedCount is None or not userExists:
+                return None
+        result = self._record(post_id, user_id, storedCount, storedLiked, flushes)
+        if result is None:
+            # a flush landed since we looked, so what we read may be stale
+            return self.toggle(post_id, user_id)
+        self._events.inc()
+        return result
+
+    def _record(self, post_id, user_id, storedCount, storedLiked, flushes):
+        key = (post_id, user_id)
+        with self._lock:
+            entry = self._pending.get(key)
+            flushing = self._flushing.get(key)
+            if entry is None and flushing is None and (storedLiked is None or self._flushes != flushes):
+                return None
+            post = self._posts.get(post_id)
+            if post is None:
+                post = self._posts[post_id] = [storedCount, 0, 0]
+            if entry is None:
+                current = flushing[1] if flushing is not None else storedLiked
+                entry = [current, current, time.time()]
+                self._pending[key] = entry
+                post[2] += 1
+            liked = not entry[1]
+            post[1] += 1 if liked else -1
+            entry[1] = liked
+            if entry[0] == entry[1]:
+                del self._pending[key]
+                post[2] -= 1
+            count = post[0] + post[1]
+            if post[2] == 0:
+                del self._posts[post_id]
+            if self._journal is None:
+                self._open_segment()
+            self._journal.write('%d %d %d\n' % (post_id, user_id, liked))
+            self._journal.flush()
+            if self.fsync:
+                os.fsync(self._journal.fileno())
+            if len(self._pending) >= self.flush_events:
+                self._wake.set()
+            return count, liked
+
+    def like_count(self, post_id, stored):
+        """Return stored with this worker's buffered toggles of post_id applied."""
+        with self._lock:
+            post = self._posts.get(post_id)
+            return stored if post is None else stored + post[1]
+
+    def stamp(self):
+        """Return a digest of this worker's buffered like count changes.
+
+        0 when none are buffered. Bodies that show counts through
+        like_count depend on these changes as well as on the stored rows,
+        so their ETags carry it; toggles that cancel out leave it as it
+        was, as they do the counts.
+        """
+        with self._lock:
+            deltas = sorted((post_id, post[1]) for post_id, post in self._posts.items() if post[1])
+        return zlib.crc32(repr(deltas).encode()) if deltas else 0
+
+    def _apply(self, batch):
+        keys = list(batch)
+        rows = db.session.execute(FLUSH_LIKES, {'user_ids': [k[1] for k in keys], 'post_ids': [
+                                  k[0] for k in keys], 'liked': [batch[k][1] for k in keys]}).fetchall()
+        db.session.commit()
+        return rows
+
+    def flush(self):
+        """Write buffered toggles to Postgres and return how many were written."""
+        with self._flush_lock:
+            with self._lock:
+                if not self._pending:
+                    return 0
+                batch = self._flushing = self._pending
+                self._pending = {}
+                self._close_segment()
+                self._open_segment()
+                segments = list(self._closed)
+            start = time.perf_counter()
+            try:
+                counted = self._apply(batch)
+            except Exception:
+                db.session.rollback()
+                self._errors.inc()
+                with self._lock:
+                    for key, entry in batch.items():
+                        newer = self._pending.get(key)
+                        if newer is None:
+                            self._pending[key] = entry
+                            continue
+                        post = self._posts[key[0]]
+                        post[2] -= 1
+                        newer[0], newer[2] = entry[0], entry[2]
+                        if newer[0] == newer[1]:
+                            del self._pending[key]
+                            post[2] -= 1
+                            if post[2] == 0:
+                                del self._posts[key[0]]
+                    self._flushing = {}
+                raise
+            self._flush_seconds.observe(time.perf_counter() - start)
+            self._flushed.inc(len(batch))
+            with self._lock:
+                for post_id, likeCount in counted:
+                    self._posts[post_id][0] = likeCount
+                for (post_id, user_id), (base, liked, bufferedAt) in batch.items():
+                    post = self._posts[post_id]
+                    post[1] -= int(liked) - int(base)
+                    post[2] -= 1
+                    if post[2] == 0:
+                        del self._posts[post_id]
+                self._flushing = {}
+                self._flushes += 1
+                for path in segments:
+                    self._closed.remove(path)
+            for path in segments:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+            return len(batch)
+
+    def replay(self):
+        """Write the journals of dead workers to Postgres and delete them."""
+        states = {}
+        claimed = []
+        for path in sorted(glob.glob(os.path.join(self.journal_dir, 'likes-*.journal'))):
+            name = os.path.basename(path)
+            pid = int(name.split('-')[1])
+            if pid != os.getpid() and _pid_alive(pid):
+                continue
+            # renamed under our pid, so a crash mid-replay leaves it for the next worker
+            claim = os.path.join(self.journal_dir, 'likes-%d-000000-%s' % (os.getpid(), name))
+            try:
+                os.rename(path, claim)
+            except FileNotFoundError:
+                continue
+            claimed.append(claim)
+        for path in claimed:
+            with open(path) as journal:
+                for line in journal:
+                    fields = line.split()
+                    if len(fields) == 3:
+                        post_id, user_id, liked = map(int, fields)
+                        states[(post_id, user_id)] = [None, bool(liked), None]
+        if states:
+            self._apply(states)
+        for path in claimed:
+            os.remove(path)
+        return len(states)
+
+    def _run(self, app):
+        while not self._stopped.is_set():
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            with app.app_context():
+                try:
+                    self.flush()
+                except Exception:
+                    app.logger.exception('like buffer flush failed')
+                finally:
+                    db.session.remove()
+
+    def start(self, app):
+        """Replay leftover journals and start the background flush thread."""
+        if self._thread is not None:
+            return
+        self._app = app
+        os.makedirs(self.journal_dir, exist_ok=True)
+        with app.app_context():
+            try:
+                replayed = self.replay()
+                if replayed:
+                    app.logger.info('replayed %d buffered likes', replayed)
+            finally:
+                db.session.remove()
+        self._thread = threading.Thread(
+            target=self._run, args=(app,), name='like-buffer', daemon=True)
+        self._thread.start()
+        atexit.register(self.stop)
+
+    def stop(self):
+        """Stop the flush thread and write out whatever is still buffered."""
+        if self._thread is None:
+            return
+        self._stopped.set()
+        self._wake.set()
+        self._thread.join()
+        self._thread = None
+        with self._app.app_context():
+            try:
+                self.flush()
+            finally:
+                db.session.remove()
+        with self._lock:
+            self._close_segment()
+        for path in list(self._closed):
+            if os.path.getsize(path) == 0:
+                os.remove(path)
+                self._closed.remove(path)
+
+
+like_buffer = LikeBuffer()
@@ -0,0 +1,87 @@
+import array
+import bisect
+import os
+
+from cache import LRUCache
+from db import db
+from models import Like
+
+
+def liked_subset(liked, post_ids):
+    """Return the subset of post_ids found in liked, a sorted array of post ids."""
+    found = set()
+    for post_id in post_ids:
+        i = bisect.bisect_left(liked, post_id)
+        if i < len(liked) and liked[i] == post_id:
+            found.add(post_id)
+    return found
+
+
+class LikedPostsCache(object):
+    """Per-user sorted arrays of liked post ids, held in a bounded LRU.
+
+    Each array is stored with the User.likes_version it was read at, and
+    callers pass the version from the user row they already loaded, so a
+    like made through another worker is seen on the next request. A
+    worker's own toggles patch its array in place. Likes held in the
+    write-behind buffer reach other workers when they are flushed.
+    """
+
+    def __init__(self, maxsize, ttl=None):
+        self._cache = LRUCache(maxsize=maxsize, ttl=ttl)
+
+    def store(self, user_id, version, post_ids):
+        """Cache post_ids, in ascending order, as the posts user_id has liked."""
+        liked = array.array('q', post_ids)
+        self._cache.set(user_id, (version, liked))
+        return liked
+
+    def peek(self, user_id, version):
+        """Return the cached array for user_id at version without loading it, or None."""
+        entry = self._cache.get(user_id)
+        if entry is None or entry[0] != version:
+            return None
+        return entry[1]
+
+    def _load(self, user_id, version):
+        return self.store(user_id, version, (row[0] for row in db.session.query(
+            Like.post_id).filter_by(user_id=user_id).order_by(Like.post_id)))
+
+    def get(self, user_id, version):
+        liked = self.peek(user_id, version)
+        if liked is None:
+            liked = self._load(user_id, version)
+        return liked
+
+    def liked_among(self, user_id, version, post_ids):
+        """Return the subset of post_ids that user_id has liked."""
+        return liked_subset(self.get(user_id, version), post_ids)
+
+    def set_liked(self, user_id, post_id, is_liked, version=None):
+        """Patch a cached array after a like toggle.
+
+        version is the likes_version the toggle moved the user to, or None
+        when the toggle is only buffered and the version has not moved. If
+        the cached array missed other changes it is dropped instead.
+        """
+        entry = self._cache.get(user_id)
+        if entry is None:
+            return
+        cached, liked = entry
+        if version is None:
+            version = cached
+        elif cached != version - 1:
+            self._cache.delete(user_id)
+            return
+        updated = array.array('q', liked)
+        i = bisect.bisect_left(updated, post_id)
+        present = i < len(updated) and updated[i] == post_id
+        if is_liked and not present:
+            updated.insert(i, post_id)
+        elif not is_liked and present:
+            del updated[i]
+        self._cache.set(user_id, (version, updated))
+
+
+liked_posts = LikedPostsCache(maxsize=int(os.getenv('LIKED_CACHE_SIZE', 10000)),
+                              ttl=int(os.getenv('LIKED_CACHE_TTL', 60)))
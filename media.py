@@ -0,0 +1,145 @@
+import datetime
+import os
+import time
+
+import boto3
+from boto3.s3.transfer import TransferConfig
+from sqlalchemy import delete, exists
+
+from cache import LRUCache
+from db import db
+from models import Item, Media, Merchant, Post, User
+
+UPLOAD_PART_SIZE = int(os.getenv('UPLOAD_PART_SIZE', 8 * 1024 * 1024))
+UPLOAD_CONCURRENCY = int(os.getenv('UPLOAD_CONCURRENCY', 4))
+UPLOAD_MAX_SIZE = int(os.getenv('UPLOAD_MAX_SIZE', 100 * 1024 * 1024))
+UPLOAD_URL_TTL = int(os.getenv('UPLOAD_URL_TTL', 900))
+PENDING_MEDIA_TTL = int(os.getenv('PENDING_MEDIA_TTL', 24 * 3600))
+
+s3 = boto3.client('s3', aws_access_key_id=os.getenv('S3_KEY'),
+                  aws_secret_access_key=os.getenv('S3_SECRET_ACCESS_KEY'),
+                  region_name=os.getenv('S3_REGION'))
+
+upload_config = TransferConfig(multipart_threshold=UPLOAD_PART_SIZE,
+                               multipart_chunksize=UPLOAD_PART_SIZE,
+                               max_concurrency=UPLOAD_CONCURRENCY)
+upload_config.max_in_memory_upload_chunks = UPLOAD_CONCURRENCY
+
+
+def upload_stream(stream, bucket, key, content_type, client=None):
+    """Stream a file-like object to S3 without reading it into memory.
+
+    Objects larger than UPLOAD_PART_SIZE go up as a multipart upload whose
+    parts are sent by UPLOAD_CONCURRENCY threads, with at most that many
+    parts buffered at once. A failed multipart upload is aborted so no
+    orphaned parts are left behind.
+    """
+    (client or s3).upload_fileobj(stream, bucket, key, ExtraArgs={
+        'ContentType': content_type}, Config=upload_config)
+
+
+def presign_upload(bucket, key, content_type, size, client=None):
+    """Return a presigned POST (url and form fields) for a direct upload.
+
+    S3 rejects the upload unless it has exactly this content type and is
+    no larger than size bytes.
+    """
+    return (client or s3).generate_presigned_post(
+        bucket, key, Fields={'Content-Type': content_type},
+        Conditions=[{'Content-Type': content_type},
+                    ['content-length-range', 1, size]],
+        ExpiresIn=UPLOAD_URL_TTL)
+
+
+class MediaUrlResolver(object):
+    """Turns Media rows (or their object keys) into client-facing URLs.
+
+    URLs are served from cdn_base_url when one is configured, otherwise
+    from the bucket's S3 endpoint. With signed=True, S3 URLs are presigned
+    GET URLs; each signature is cached and reused until refresh_margin
+    seconds before it expires.
+    """
+
+    def __init__(self, bucket, region, cdn_base_url=None, signed=False, expires_in=3600,
+                 refresh_margin=300, client=None, maxsize=100000):
+        self.bucket = bucket
+        self.signed = signed and not cdn_base_url
+        self.expires_in = expires_in
+        self.refresh_margin = refresh_margin
+        self._client = client
+        if cdn_base_url:
+            self._base = cdn_base_url.rstrip('/') + '/'
+        else:
+            self._base = 'https://' + \
+                str(bucket) + '.s3.' + str(region) + '.amazonaws.com/'
+        self._signatures = LRUCache(maxsize=maxsize)
+
+    def url_for_key(self, key):
+        if not self.signed:
+            return self._base + key
+        cached = self._signatures.get(key)
+        now = time.time()
+        if cached is not None and cached[1] - self.refresh_margin > now:
+            return cached[0]
+        url = self._client.generate_presigned_url('get_object', Params={
+            'Bucket': self.bucket, 'Key': key}, ExpiresIn=self.expires_in)
+        self._signatures.set(key, (url, now + self.expires_in))
+        return url
+
+    def url(self, media):
+        return self.url_for_key(media.key)
+
+    def epoch(self):
+        """Return the current signing epoch, or None when URLs are not signed.
+
+        Every signature handed out has at least refresh_margin seconds
+        left, so a body built during an epoch of half that stays valid
+        for as long as it is served, with the rest of the margin left
+        for clients that keep it for its max-age.
+        """
+        if not self.signed:
+            return None
+        return int(time.time() // max(1, self.refresh_margin // 2))
+
+
+media_urls = MediaUrlResolver(
+    os.getenv('S3_BUCKET'), os.getenv('S3_REGION'),
+    cdn_base_url=os.getenv('MEDIA_CDN_URL'),
+    signed=os.getenv('S3_SIGNED_URLS', '').lower() in ('1', 'true', 'yes'),
+    expires_in=int(os.getenv('S3_SIGNED_URL_TTL', 3600)),
+    client=s3)
+
+
+def active_ids(media_ids):
+    """Return the ids among media_ids of media that may be referenced.
+
+    Media created for a direct upload stays pending until the upload is
+    confirmed, and cannot be shown before then.
+    """
+    media_ids = set(media_ids)
+    if not media_ids:
+        return set()
+    return {row[0] for row in db.session.query(Media.id).filter(
+        Media.id.in_(media_ids), Media.status == 'active')}
+
+
+def expire_pending(max_age=PENDING_MEDIA_TTL, client=None):
+    """Delete pending media older than max_age seconds, with their objects.
+
+    These are direct uploads that were never confirmed. Rows something
+    still refers to are left alone. The rows go first, in one statement
+    that re-checks every condition, and only the objects of rows it
+    actually deleted are removed, so a confirm that lands meanwhile keeps
+    its object. Returns how many were deleted.
+    """
+    cutoff = datetime.datetime.utcnow() - datetime.timedelta(seconds=max_age)
+    keys = [uuid + '/' + name for uuid, name in db.session.execute(delete(Media).where(
+        Media.status == 'pending', Media.date_uploaded < cutoff,
+        ~exists().where(Merchant.logo_id == Media.id), ~exists().where(Post.media_id == Media.id),
+        ~exists().where(Item.media_id == Media.id), ~exists().where(User.media_id == Media.id)
+    ).returning(Media.uuid, Media.name).execution_options(synchronize_session=False))]
+    db.session.commit()
+    for start in range(0, len(keys), 1000):
+        (client or s3).delete_objects(Bucket=media_urls.bucket, Delete={
+            'Objects': [{'Key': key} for key in keys[start:start + 1000]], 'Quiet': True})
+    return len(keys)
@@ -0,0 +1,88 @@
+import bisect
+import threading
+
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01,
+                   0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+class Counter(object):
+    def __init__(self):
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+    def snapshot(self):
+        return self.value
+
+
+class Gauge(object):
+    """A value set directly, or read from fn at snapshot time."""
+
+    def __init__(self, fn=None):
+        self.value = 0
+        self.fn = fn
+
+    def set(self, value):
+        self.value = value
+
+    def snapshot(self):
+        return self.fn() if self.fn is not None else self.value
+
+
+class Histogram(object):
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[i] += 1
+            self.sum += value
+            self.count += 1
+
+    def snapshot(self):
+        with self._lock:
+            buckets = {}
+            total = 0
+            for bound, n in zip(self.buckets + ('+Inf',), self.counts):
+                total += n
+                buckets[str(bound)] = total
+            return {'count': self.count, 'sum': self.sum, 'buckets': buckets}
+
+
+_registry = {}
+_lock = threading.Lock()
+
+
+def _metric(name, factory):
+    with _lock:
+        metric = _registry.get(name)
+        if metric is None:
+            metric = _registry[name] = factory()
+        return metric
+
+
+def counter(name):
+    return _metric(name, Counter)
+
+
+def gauge(name, fn=None):
+    return _metric(name, lambda: Gauge(fn))
+
+
+def histogram(name, buckets=DEFAULT_BUCKETS):
+    return _metric(name, lambda: Histogram(buckets))
+
+
+def snapshot():
+    """Return every metric of this worker process by name."""
+    with _lock:
+        metrics = dict(_registry)
+    return {name: metric.snapshot() for name, metric in sorted(metrics.items())}
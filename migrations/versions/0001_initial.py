@@ -0,0 +1,124 @@
+"""initial schema
+
+The tables as db.create_all() used to create them. A database created that
+way already has them; mark it with `flask db stamp 0001` and then run
+`flask db upgrade`.
+
+Revision ID: 0001
+Revises:
+Create Date: 2021-09-20 10:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = '0001'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('media',
+                    sa.Column('id', sa.Integer(), nullable=False),
+                    sa.Column('uuid', sa.Text(), nullable=False),
+                    sa.Column('name', sa.Text(), nullable=False),
+                    sa.Column('mimetype', sa.Text(), nullable=False),
+                    sa.Column('date_uploaded', sa.DateTime(), nullable=False),
+                    sa.PrimaryKeyConstraint('id')
+                    )
+    op.create_table('merchant',
+                    sa.Column('id', sa.Integer(), nullable=False),
+                    sa.Column('logo_id', sa.Integer(), nullable=False),
+                    sa.Column('name', sa.Text(), nullable=False),
+                    sa.ForeignKeyConstraint(['logo_id'], ['media.id'], ),
+                    sa.PrimaryKeyConstraint('id'),
+                    sa.UniqueConstraint('name')
+                    )
+    op.create_table('user',
+                    sa.Column('id', sa.Integer(), nullable=False),
+                    sa.Column('media_id', sa.Integer(), nullable=False),
+                    sa.Column('name', sa.Text(), nullable=False),
+                    sa.ForeignKeyConstraint(['media_id'], ['media.id'], ),
+                    sa.PrimaryKeyConstraint('id')
+                    )
+    op.create_table('item',
+                    sa.Column('id', sa.Integer(), nullable=False),
+                    sa.Column('name', sa.Text(), nullable=False),
+                    sa.Column('media_id', sa.Integer(), nullable=False),
+                    sa.Column('merchant_id', sa.Integer(), nullable=False),
+                    sa.Column('description', sa.Text(), nullable=True),
+                    sa.Column('price', sa.Integer(), nullable=False),
+                    sa.Column('currency', sa.Text(), nullable=False),
+                    sa.ForeignKeyConstraint(['media_id'], ['media.id'], ),
+                    sa.ForeignKeyConstraint(
+                        ['merchant_id'], ['merchant.id'], ),
+                    sa.PrimaryKeyConstraint('id')
+                    )
+    op.create_table('offer',
+                    sa.Column('id', sa.Integer(), nullable=False),
+                    sa.Column('user_id', sa.Integer(), nullable=False),
+                    sa.Column('name', sa.Text(), nullable=False),
+                    sa.Column('type', sa.Integer(), nullable=False),
+                    sa.Column('fixed_amount', sa.Integer(), nullable=True),
+                    sa.Column('percentage', sa.Integer(), nullable=True),
+                    sa.Column('currency', sa.Text(), nullable=False),
+                    sa.Column('start_date', sa.DateTime(), nullable=False),
+                    sa.Column('end_date', sa.DateTime(), nullable=False),
+                    sa.ForeignKeyConstraint(['user_id'], ['merchant.id'], ),
+                    sa.PrimaryKeyConstraint('id')
+                    )
+    op.create_table('post',
+                    sa.Column('id', sa.Integer(), nullable=False),
+                    sa.Column('media_id', sa.Integer(), nullable=False),
+                    sa.Column('date_posted', sa.DateTime(), nullable=False),
+                    sa.Column('user_id', sa.Integer(), nullable=False),
+                    sa.Column('title', sa.Text(), nullable=True),
+                    sa.Column('items', postgresql.ARRAY(
+                        sa.Integer()), nullable=True),
+                    sa.Column('offer_id', sa.Integer(), nullable=True),
+                    sa.ForeignKeyConstraint(['media_id'], ['media.id'], ),
+                    sa.ForeignKeyConstraint(['offer_id'], ['offer.id'], ),
+                    sa.ForeignKeyConstraint(['user_id'], ['merchant.id'], ),
+                    sa.PrimaryKeyConstraint('id')
+                    )
+    op.create_table('boost',
+                    sa.Column('id', sa.Integer(), nullable=False),
+                    sa.Column('post_id', sa.Integer(), nullable=False),
+                    sa.Column('end_time', sa.DateTime(), nullable=False),
+                    sa.ForeignKeyConstraint(['post_id'], ['post.id'], ),
+                    sa.PrimaryKeyConstraint('id')
+                    )
+    op.create_table('comment',
+                    sa.Column('id', sa.Integer(), nullable=False),
+                    sa.Column('user_id', sa.Integer(), nullable=False),
+                    sa.Column('post_id', sa.Integer(), nullable=False),
+                    sa.Column('date_posted', sa.DateTime(), nullable=False),
+                    sa.Column('content', sa.Text(), nullable=False),
+                    sa.ForeignKeyConstraint(['post_id'], ['post.id'], ),
+                    sa.ForeignKeyConstraint(['user_id'], ['user.id'], ),
+                    sa.PrimaryKeyConstraint('id')
+                    )
+    op.create_table('like',
+                    sa.Column('id', sa.Integer(), nullable=False),
+                    sa.Column('user_id', sa.Integer(), nullable=False),
+                    sa.Column('post_id', sa.Integer(), nullable=False),
+                    sa.ForeignKeyConstraint(['post_id'], ['post.id'], ),
+                    sa.ForeignKeyConstraint(['user_id'], ['user.id'], ),
+                    sa.PrimaryKeyConstraint('id')
+                    )
+
+
+def downgrade():
+    op.drop_table('like')
+    op.drop_table('comment')
+    op.drop_table('boost')
+    op.drop_table('post')
+    op.drop_table('offer')
+    op.drop_table('item')
+    op.drop_table('user')
+    op.drop_table('merchant')
+    op.drop_table('media')
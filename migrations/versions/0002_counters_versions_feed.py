@@ -0,0 +1,76 @@
+"""post counters, row versions, media renditions and the feed table
+
+Backfills like_count and comment_count. feed_entry starts empty; fill it
+with `flask rebuild-feed`.
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2021-10-04 10:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = '0002'
+down_revision = '0001'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('merchant', sa.Column('version', sa.Integer(),
+                  server_default='1', nullable=False))
+    op.add_column('media', sa.Column('status', sa.Text(),
+                  server_default='active', nullable=False))
+    op.add_column('media', sa.Column(
+        'renditions', postgresql.JSONB(astext_type=sa.Text()), nullable=True))
+    op.add_column('post', sa.Column('like_count', sa.Integer(),
+                  server_default='0', nullable=False))
+    op.add_column('post', sa.Column('comment_count', sa.Integer(),
+                  server_default='0', nullable=False))
+    op.add_column('post', sa.Column('version', sa.Integer(),
+                  server_default='1', nullable=False))
+    op.execute('UPDATE post SET '
+               'like_count = (SELECT count(*) FROM "like" WHERE "like".post_id = post.id), '
+               'comment_count = (SELECT count(*) FROM comment WHERE comment.post_id = post.id)')
+
+    op.create_table('feed_entry',
+                    sa.Column('post_id', sa.Integer(), nullable=False),
+                    sa.Column('merchant_id', sa.Integer(), nullable=False),
+                    sa.Column('date_posted', sa.DateTime(), nullable=False),
+                    sa.Column('title', sa.Text(), nullable=True),
+                    sa.Column('merchant_name', sa.Text(), nullable=False),
+                    sa.Column('logo_id', sa.Integer(), nullable=False),
+                    sa.Column('logo_key', sa.Text(), nullable=False),
+                    sa.Column('logo_mimetype', sa.Text(), nullable=False),
+                    sa.Column('media_id', sa.Integer(), nullable=False),
+                    sa.Column('media_key', sa.Text(), nullable=False),
+                    sa.Column('media_feed_key', sa.Text(), nullable=False),
+                    sa.Column('media_mimetype', sa.Text(), nullable=False),
+                    sa.Column('like_count', sa.Integer(), nullable=False),
+                    sa.Column('comment_count', sa.Integer(), nullable=False),
+                    sa.Column('boost_end', sa.DateTime(), nullable=True),
+                    sa.Column('items', postgresql.JSONB(
+                        astext_type=sa.Text()), nullable=False),
+                    sa.ForeignKeyConstraint(
+                        ['merchant_id'], ['merchant.id'], ),
+                    sa.ForeignKeyConstraint(
+                        ['post_id'], ['post.id'], ondelete='CASCADE'),
+                    sa.PrimaryKeyConstraint('post_id')
+                    )
+    op.create_index('ix_feed_entry_date_posted_post_id', 'feed_entry', [
+                    'date_posted', 'post_id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_feed_entry_date_posted_post_id', table_name='feed_entry')
+    op.drop_table('feed_entry')
+    op.drop_column('post', 'version')
+    op.drop_column('post', 'comment_count')
+    op.drop_column('post', 'like_count')
+    op.drop_column('media', 'renditions')
+    op.drop_column('media', 'status')
+    op.drop_column('merchant', 'version')
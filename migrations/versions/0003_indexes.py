@@ -0,0 +1,55 @@
+"""secondary indexes and a unique like per user and post
+
+Duplicate likes are removed, and like_count recounted, before the unique
+constraint goes in. The indexes are built concurrently so the tables stay
+writable while they build.
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2021-10-18 10:00:00.000000
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '0003'
+down_revision = '0002'
+branch_labels = None
+depends_on = None
+
+INDEXES = [
+    ('ix_post_user_id_date_posted', 'post', ['user_id', 'date_posted'], {}),
+    ('ix_post_date_posted', 'post', ['date_posted'], {}),
+    ('ix_post_media_id', 'post', ['media_id'], {}),
+    ('ix_post_items', 'post', ['items'], {'postgresql_using': 'gin'}),
+    ('ix_like_user_id_post_id', 'like', ['user_id', 'post_id'], {}),
+    ('ix_comment_post_id_date_posted', 'comment',
+     ['post_id', 'date_posted', 'id'], {}),
+    ('ix_item_merchant_id_name', 'item', ['merchant_id', 'name'], {}),
+    ('ix_item_media_id', 'item', ['media_id'], {}),
+    ('ix_boost_post_id_end_time', 'boost', ['post_id', 'end_time'], {}),
+    ('ix_feed_entry_merchant_id', 'feed_entry', ['merchant_id'], {}),
+    ('ix_feed_entry_media_id', 'feed_entry', ['media_id'], {}),
+]
+
+
+def upgrade():
+    op.execute('DELETE FROM "like" a USING "like" b '
+               'WHERE a.post_id = b.post_id AND a.user_id = b.user_id AND a.id > b.id')
+    op.execute('UPDATE post SET like_count = '
+               '(SELECT count(*) FROM "like" WHERE "like".post_id = post.id)')
+    with op.get_context().autocommit_block():
+        op.create_index('uq_like_post_id_user_id', 'like', [
+                        'post_id', 'user_id'], unique=True, postgresql_concurrently=True)
+        op.execute('ALTER TABLE "like" ADD CONSTRAINT uq_like_post_id_user_id '
+                   'UNIQUE USING INDEX uq_like_post_id_user_id')
+        for name, table, columns, kw in INDEXES:
+            op.create_index(name, table, columns,
+                            postgresql_concurrently=True, **kw)
+
+
+def downgrade():
+    for name, table, columns, kw in reversed(INDEXES):
+        op.drop_index(name, table_name=table)
+    op.drop_constraint('uq_like_post_id_user_id', 'like', type_='unique')
@@ -0,0 +1,34 @@
+"""user profile versions
+
+User.version is taken from user_version_seq on every profile edit, so
+max(version), read from its index, changes whenever a profile does.
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2021-10-25 10:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0004'
+down_revision = '0003'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute('CREATE SEQUENCE user_version_seq')
+    op.add_column('user', sa.Column('version', sa.BigInteger(),
+                  server_default='0', nullable=False))
+    with op.get_context().autocommit_block():
+        op.create_index('ix_user_version', 'user', ['version'],
+                        postgresql_concurrently=True)
+
+
+def downgrade():
+    op.drop_index('ix_user_version', table_name='user')
+    op.drop_column('user', 'version')
+    op.execute('DROP SEQUENCE user_version_seq')
@@ -0,0 +1,28 @@
+"""user likes versions
+
+User.likes_version is bumped whenever the user's like rows change, so a
+worker can tell its cached liked-post ids are stale.
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2021-10-27 10:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0005'
+down_revision = '0004'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('user', sa.Column('likes_version', sa.BigInteger(),
+                  server_default='0', nullable=False))
+
+
+def downgrade():
+    op.drop_column('user', 'likes_version')
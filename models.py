@@ -9,6 +9,8 @@ class Merchant(db.Model):
     logo_id = db.Column(db.Integer, db.ForeignKey(
         'media.id'), nullable=False, default=1)
     name = db.Column(db.Text, nullable=False, unique=True)
+    version = db.Column(db.Integer, nullable=False,
+                        default=1, server_default='1')
     posts = db.relationship('Post', backref='author', lazy=True)
 
     def __repr__(self):
@@ -20,14 +22,21 @@ class Media(db.Model):
     uuid = db.Column(db.Text, nullable=False)
     name = db.Column(db.Text, nullable=False)
     mimetype = db.Column(db.Text, nullable=False)
+    status = db.Column(db.Text, nullable=False,
+                       default='active', server_default='active')
+    renditions = db.Column(postgresql.JSONB, nullable=True)
     date_uploaded = db.Column(
         db.DateTime, nullable=False, default=datetime.utcnow)
 
     def __repr__(self):
         return f"Media('{self.id}', '{self.uuid}', '{self.name}')"
 
-    def get_url(self, bucket, region):
-        return 'https://'+bucket+'.s3.'+region+'.amazonaws.com/'+self.uuid+'/'+self.name
+    @property
+    def key(self):
+        return self.uuid+'/'+self.name
+
+    def rendition_key(self, kind):
+        return (self.renditions or {}).get(kind, self.key)
 
 
 class Post(db.Model):
@@ -40,8 +49,20 @@ class Post(db.Model):
     title = db.Column(db.Text, nullable=True)
     items = db.Column(postgresql.ARRAY(db.Integer), nullable=True)
     offer_id = db.Column(db.Integer, db.ForeignKey('offer.id'), nullable=True)
+    like_count = db.Column(db.Integer, nullable=False,
+                           default=0, server_default='0')
+    comment_count = db.Column(db.Integer, nullable=False,
+                              default=0, server_default='0')
+    version = db.Column(db.Integer, nullable=False,
+                        default=1, server_default='1')
     likes = db.relationship('Like', backref='post', lazy='select')
     comments = db.relationship('Comment', backref='post', lazy='select')
+    __table_args__ = (
+        db.Index('ix_post_user_id_date_posted', 'user_id', 'date_posted'),
+        db.Index('ix_post_date_posted', 'date_posted'),
+        db.Index('ix_post_media_id', 'media_id'),
+        db.Index('ix_post_items', 'items', postgresql_using='gin'),
+    )
 
     def __repr__(self):
         return f"Post('{self.id}', '{self.media}',  '{self.date_posted}')"
@@ -49,16 +70,33 @@ class Post(db.Model):
         return f"Post('{self.id}', '{self.media}',  '{self.date_posted}')"
 
 
+# Profile edits take their User.version from one sequence, so the
+# largest version moves whenever any profile changes.
+user_version_seq = db.Sequence('user_version_seq', metadata=db.Model.metadata)
+
+
 class User(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     media_id = db.Column(db.Integer, db.ForeignKey('media.id'), nullable=False)
     name = db.Column(db.Text, nullable=False)
+    version = db.Column(db.BigInteger, nullable=False,
+                        default=0, server_default='0')
+    likes_version = db.Column(db.BigInteger, nullable=False,
+                              default=0, server_default='0')
+    __table_args__ = (
+        db.Index('ix_user_version', 'version'),
+    )
 
 
 class Like(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     post_id = db.Column(db.Integer, db.ForeignKey('post.id'), nullable=False)
+    __table_args__ = (
+        db.UniqueConstraint('post_id', 'user_id',
+                            name='uq_like_post_id_user_id'),
+        db.Index('ix_like_user_id_post_id', 'user_id', 'post_id'),
+    )
 
 
 class Comment(db.Model):
@@ -68,6 +106,10 @@ class Comment(db.Model):
     date_posted = db.Column(db.DateTime, nullable=False,
                             default=datetime.utcnow)
     content = db.Column(db.Text, nullable=False)
+    __table_args__ = (
+        db.Index('ix_comment_post_id_date_posted',
+                 'post_id', 'date_posted', 'id'),
+    )
 
 
 class Offer(db.Model):
@@ -94,6 +136,10 @@ class Item(db.Model):
     description = db.Column(db.Text, nullable=True)
     price = db.Column(db.Integer, nullable=False, default=0)
     currency = db.Column(db.Text, nullable=False)
+    __table_args__ = (
+        db.Index('ix_item_merchant_id_name', 'merchant_id', 'name'),
+        db.Index('ix_item_media_id', 'media_id'),
+    )
 
 
 class Boost(db.Model):
@@ -101,3 +147,32 @@ class Boost(db.Model):
     post_id = db.Column(db.Integer, db.ForeignKey('post.id'), nullable=False)
     end_time = db.Column(db.DateTime, nullable=False,
                          default=datetime.utcnow)
+    __table_args__ = (
+        db.Index('ix_boost_post_id_end_time', 'post_id', 'end_time'),
+    )
+
+
+class FeedEntry(db.Model):
+    post_id = db.Column(db.Integer, db.ForeignKey(
+        'post.id', ondelete='CASCADE'), primary_key=True)
+    merchant_id = db.Column(db.Integer, db.ForeignKey(
+        'merchant.id'), nullable=False)
+    date_posted = db.Column(db.DateTime, nullable=False)
+    title = db.Column(db.Text, nullable=True)
+    merchant_name = db.Column(db.Text, nullable=False)
+    logo_id = db.Column(db.Integer, nullable=False)
+    logo_key = db.Column(db.Text, nullable=False)
+    logo_mimetype = db.Column(db.Text, nullable=False)
+    media_id = db.Column(db.Integer, nullable=False)
+    media_key = db.Column(db.Text, nullable=False)
+    media_feed_key = db.Column(db.Text, nullable=False)
+    media_mimetype = db.Column(db.Text, nullable=False)
+    like_count = db.Column(db.Integer, nullable=False, default=0)
+    comment_count = db.Column(db.Integer, nullable=False, default=0)
+    boost_end = db.Column(db.DateTime, nullable=True)
+    items = db.Column(postgresql.JSONB, nullable=False, default=list)
+    __table_args__ = (
+        db.Index('ix_feed_entry_date_posted_post_id', 'date_posted', 'post_id'),
+        db.Index('ix_feed_entry_merchant_id', 'merchant_id'),
+        db.Index('ix_feed_entry_media_id', 'media_id'),
+    )
@@ -0,0 +1,60 @@
+import base64
+import binascii
+import datetime
+
+DEFAULT_LIMIT = 20
+MAX_LIMIT = 100
+MAX_IDS = 200
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(date_posted, id):
+    raw = date_posted.isoformat() + '|' + str(id)
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode()).decode()
+        date_posted, id = raw.split('|')
+        return datetime.datetime.fromisoformat(date_posted), int(id)
+    except (binascii.Error, UnicodeError, ValueError):
+        raise InvalidCursor(cursor)
+
+
+def parse_limit(value, default=DEFAULT_LIMIT, maximum=MAX_LIMIT):
+    if value is None:
+        return default
+    try:
+        limit = int(value)
+    except ValueError:
+        return None
+    if limit < 1 or limit > maximum:
+        return None
+    return limit
+
+
+def parse_ids(values):
+    """Return the distinct ids in comma separated values, in first-seen order.
+
+    Raises ValueError when one of them is not an integer.
+    """
+    return list(dict.fromkeys(int(i) for value in values
+                              for i in value.split(',') if i.strip()))
+
+
+def encode_rank_cursor(now, score, id):
+    raw = repr(now) + '|' + repr(score) + '|' + str(id)
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_rank_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode()).decode()
+        now, score, id = raw.split('|')
+        return float(now), float(score), int(id)
+    except (binascii.Error, UnicodeError, ValueError):
+        raise InvalidCursor(cursor)
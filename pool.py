@@ -0,0 +1,116 @@
+import os
+import time
+
+from sqlalchemy import event
+from sqlalchemy.exc import TimeoutError as PoolTimeout
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+
+import metrics
+
+POOL_SIZE = int(os.getenv('DB_POOL_SIZE', 5))
+MAX_OVERFLOW = int(os.getenv('DB_MAX_OVERFLOW', 10))
+POOL_TIMEOUT = float(os.getenv('DB_POOL_TIMEOUT', 30))
+POOL_RECYCLE = int(os.getenv('DB_POOL_RECYCLE', -1))
+POOL_PRE_PING = os.getenv('DB_POOL_PRE_PING', '').lower() in ('1', 'true', 'yes')
+STATEMENT_TIMEOUT_MS = int(os.getenv('DB_STATEMENT_TIMEOUT_MS', 0))
+PGBOUNCER = os.getenv('DB_PGBOUNCER', '').lower() in ('1', 'true', 'yes')
+
+WAIT_BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05,
+                0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_pools = {}
+
+
+def _gauge(prefix, name, read):
+    metrics.gauge('%s.%s' % (prefix, name),
+                  lambda: read(_pools[prefix]) if prefix in _pools else 0)
+
+
+class _Instrumented(object):
+    """Times every checkout and publishes the pool's state as metrics.
+
+    <prefix>.wait_seconds covers the whole checkout: waiting for a
+    connection to be returned, and opening one when the pool has room to
+    grow. Checkouts that give up after pool_timeout are counted in
+    <prefix>.checkout_timeouts. The gauges read the live pool, which
+    changes when the engine is disposed.
+    """
+    prefix = None
+
+    def __init__(self, *args, **kwargs):
+        super(_Instrumented, self).__init__(*args, **kwargs)
+        if self.prefix not in _pools:
+            _gauge(self.prefix, 'size', lambda pool: pool.size())
+            _gauge(self.prefix, 'checked_out', lambda pool: pool.checkedout())
+            _gauge(self.prefix, 'checked_in', lambda pool: pool.checkedin())
+            _gauge(self.prefix, 'overflow', lambda pool: max(0, pool.overflow()))
+        _pools[self.prefix] = self
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            connection = super(_Instrumented, self)._do_get()
+        except PoolTimeout:
+            metrics.counter(self.prefix + '.checkout_timeouts').inc()
+            raise
+        finally:
+            metrics.histogram(self.prefix + '.wait_seconds',
+                              WAIT_BUCKETS).observe(time.perf_counter() - started)
+        metrics.counter(self.prefix + '.checkouts').inc()
+        return connection
+
+
+class InstrumentedQueuePool(_Instrumented, QueuePool):
+    prefix = 'db.pool'
+
+
+class InstrumentedAsyncQueuePool(_Instrumented, AsyncAdaptedQueuePool):
+    prefix = 'db.async_pool'
+
+
+def _pool_options(poolclass, pool_size, max_overflow):
+    return {'poolclass': poolclass, 'pool_size': pool_size, 'max_overflow': max_overflow,
+            'pool_timeout': POOL_TIMEOUT, 'pool_recycle': POOL_RECYCLE, 'pool_pre_ping': POOL_PRE_PING}
+
+
+def engine_options():
+    """SQLALCHEMY_ENGINE_OPTIONS for the Flask app's psycopg2 engine.
+
+    The statement timeout is a connection startup option, except in
+    PgBouncer mode: a transaction-pooling PgBouncer hands each
+    transaction whichever server connection is free, so session state
+    would leak between clients, and configure_engine sets it with SET
+    LOCAL at the start of each transaction instead.
+    """
+    options = _pool_options(InstrumentedQueuePool, POOL_SIZE, MAX_OVERFLOW)
+    if STATEMENT_TIMEOUT_MS and not PGBOUNCER:
+        options['connect_args'] = {
+            'options': '-c statement_timeout=%d' % STATEMENT_TIMEOUT_MS}
+    return options
+
+
+def async_engine_options(pool_size, max_overflow):
+    """create_async_engine options for the asyncpg engine of async_app.
+
+    Through PgBouncer the statement timeout is enforced by asyncpg on the
+    client side, since reads run outside a transaction where SET LOCAL
+    has no effect. asyncpg prepares every statement under a name, so
+    PgBouncer needs max_prepared_statements set to pool transactions.
+    """
+    options = _pool_options(InstrumentedAsyncQueuePool, pool_size, max_overflow)
+    if STATEMENT_TIMEOUT_MS and PGBOUNCER:
+        options['connect_args'] = {'command_timeout': STATEMENT_TIMEOUT_MS / 1000}
+    elif STATEMENT_TIMEOUT_MS:
+        options['connect_args'] = {'server_settings': {
+            'statement_timeout': str(STATEMENT_TIMEOUT_MS)}}
+    return options
+
+
+def _set_local_timeout(conn):
+    conn.exec_driver_sql('SET LOCAL statement_timeout = %d' % STATEMENT_TIMEOUT_MS)
+
+
+def configure_engine(engine):
+    if PGBOUNCER and STATEMENT_TIMEOUT_MS:
+        event.listen(engine, 'begin', _set_local_timeout)
+    return engine
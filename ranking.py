@@ -0,0 +1,154 @@
+import io
+import os
+import threading
+import time
+
+import numpy as np
+
+from db import db
+
+# Every column is cast to a fixed-width type and never null, so each row
+# of COPY's binary output has the same layout and NumPy can read the
+# whole result in place.
+COLUMNS_COPY = '''
+COPY (SELECT post_id::int8, merchant_id::int8, extract(epoch FROM date_posted)::float8,
+             like_count::float8, comment_count::float8,
+             coalesce(extract(epoch FROM boost_end), 0)::float8
+      FROM feed_entry) TO STDOUT WITH (FORMAT binary)
+'''
+COLUMN_TYPES = (('post_id', '>i8'), ('merchant_id', '>i8'), ('date_posted', '>f8'),
+                ('like_count', '>f8'), ('comment_count', '>f8'), ('boost_end', '>f8'))
+COPY_ROW = np.dtype([('fields', '>i2')] + [field for name, kind in COLUMN_TYPES
+                                            for field in (('%s_length' % name, '>i4'), (name, kind))])
+COPY_SIGNATURE = b'PGCOPY\n\xff\r\n\x00'
+
+
+def read_columns(data):
+    """Turn binary COPY output of COLUMNS_COPY into native NumPy columns."""
+    if bytes(data[:len(COPY_SIGNATURE)]) != COPY_SIGNATURE:
+        raise ValueError('not binary COPY output')
+    # signature, flags, header extension length and the extension itself
+    start = len(COPY_SIGNATURE) + 8 + int.from_bytes(data[15:19], 'big')
+    count = (len(data) - start - 2) // COPY_ROW.itemsize
+    rows = np.frombuffer(data, dtype=COPY_ROW, count=count, offset=start)
+    return {name: rows[name].astype(kind.replace('>', '=')) for name, kind in COLUMN_TYPES}
+
+
+class RankingEngine(object):
+    """Scores discover candidates held in columnar NumPy arrays.
+
+    score = recency_weight * 2^(-age / half_life)
+          + (like_weight * likes + comment_weight * comments) / (age + 2)^gravity
+          + boost_weight (while the post is boosted)
+
+    with ages in hours. The candidate columns are loaded from feed_entry
+    with one binary COPY. Once start() has run, a background thread
+    reloads them every refresh_interval seconds and swaps the new columns
+    in whole, so requests keep scoring the previous ones meanwhile.
+    Without it, columns() reloads them in line when they are older than
+    that.
+    """
+
+    def __init__(self, recency_weight=1.0, half_life=24.0, like_weight=1.0, comment_weight=2.0,
+                 gravity=1.5, boost_weight=1.0, refresh_interval=30.0):
+        self.recency_weight = recency_weight
+        self.half_life = half_life
+        self.like_weight = like_weight
+        self.comment_weight = comment_weight
+        self.gravity = gravity
+        self.boost_weight = boost_weight
+        self.refresh_interval = refresh_interval
+        self._columns = None
+        self._loaded_at = 0.0
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def load(self):
+        out = io.BytesIO()
+        connection = db.engine.raw_connection()
+        try:
+            connection.cursor().copy_expert(COLUMNS_COPY, out)
+        finally:
+            connection.close()
+        columns = read_columns(out.getbuffer())
+        self._columns = columns
+        self._loaded_at = time.monotonic()
+
+    def _stale(self):
+        return self._columns is None or (
+            self._thread is None and time.monotonic() - self._loaded_at > self.refresh_interval)
+
+    def columns(self):
+        if self._stale():
+            with self._lock:
+                if self._stale():
+                    self.load()
+        return self._columns
+
+    def _run(self, app):
+        stopped = threading.Event()
+        while not stopped.wait(self.refresh_interval):
+            with app.app_context():
+                try:
+                    self.load()
+                except Exception:
+                    app.logger.exception('ranking columns reload failed')
+
+    def start(self, app):
+        """Load the columns and start reloading them on a background thread."""
+        if self._thread is not None:
+            return
+        self.load()
+        self._thread = threading.Thread(
+            target=self._run, args=(app,), name='ranker', daemon=True)
+        self._thread.start()
+
+    def scores(self, columns, now):
+        age = np.maximum(now - columns['date_posted'], 0.0) / 3600.0
+        recency = np.exp2(-age / self.half_life)
+        velocity = (self.like_weight * columns['like_count'] + self.comment_weight
+                    * columns['comment_count']) / np.power(age + 2.0, self.gravity)
+        boost = np.where(columns['boost_end'] > now, self.boost_weight, 0.0)
+        return self.recency_weight * recency + velocity + boost
+
+    def top(self, k, now, after=None):
+        """Return (post_ids, scores) of the k best posts scored at time now.
+
+        after is the (score, post_id) of the last post on the previous page;
+        only posts ranked strictly below it are considered. Posts are
+        ordered by score, then by post_id, both descending.
+
+        Scores are computed from the columns as currently loaded, which are
+        reloaded every refresh_interval seconds. Paging with a fixed now
+        therefore continues the same ordering only while the columns stay
+        unchanged; a reload in between can move posts across the cursor
+        as their like and comment counts change.
+        """
+        columns = self.columns()
+        post_ids = columns['post_id']
+        scores = self.scores(columns, now)
+        candidates = np.arange(len(post_ids))
+        if after is not None:
+            score, post_id = after
+            candidates = np.flatnonzero((scores < score) | (
+                (scores == score) & (post_ids < post_id)))
+        if k < len(candidates):
+            # argpartition picks arbitrarily among posts tied with the k-th
+            # score, so keep every tied post and let the post_id tiebreak
+            # below decide which of them make the page.
+            kth = scores[candidates[np.argpartition(
+                -scores[candidates], k - 1)[k - 1]]]
+            candidates = candidates[scores[candidates] >= kth]
+        order = np.lexsort((-post_ids[candidates], -scores[candidates]))
+        candidates = candidates[order][:k]
+        return post_ids[candidates].tolist(), scores[candidates].tolist()
+
+
+ranker = RankingEngine(
+    recency_weight=float(os.getenv('RANK_RECENCY_WEIGHT', 1.0)),
+    half_life=float(os.getenv('RANK_HALF_LIFE_HOURS', 24.0)),
+    like_weight=float(os.getenv('RANK_LIKE_WEIGHT', 1.0)),
+    comment_weight=float(os.getenv('RANK_COMMENT_WEIGHT', 2.0)),
+    gravity=float(os.getenv('RANK_GRAVITY', 1.5)),
+    boost_weight=float(os.getenv('RANK_BOOST_WEIGHT', 1.0)),
+    refresh_interval=float(os.getenv('RANK_REFRESH_INTERVAL', 30.0)))
@@ -0,0 +1,98 @@
+import io
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image, ImageOps
+
+from db import db
+from models import Merchant, Media, Post, Item
+from media import s3, media_urls
+import feed
+import counters
+
+RENDITIONS = {'thumbnail': 160, 'feed': 720, 'full': 1440}
+MAX_WORKERS = int(os.getenv('RENDITION_WORKERS', 2))
+MAX_PENDING = int(os.getenv('RENDITION_MAX_PENDING', 100))
+MAX_ATTEMPTS = int(os.getenv('RENDITION_ATTEMPTS', 3))
+RETRY_DELAY = float(os.getenv('RENDITION_RETRY_DELAY', 2))
+
+
+def generate(media):
+    """Resize an image Media into RENDITIONS and record their keys on it.
+
+    Each rendition is scaled to fit a square of the given edge, never
+    upscaled, and stored beside the original as <uuid>/<kind>/<name>.
+    Non-image media is left alone.
+    """
+    if not media.mimetype.startswith('image/'):
+        return
+    body = s3.get_object(Bucket=media_urls.bucket, Key=media.key)['Body'].read()
+    source = Image.open(io.BytesIO(body))
+    imageFormat = source.format
+    original = ImageOps.exif_transpose(source)
+    renditions = {}
+    for kind, edge in RENDITIONS.items():
+        image = original.copy()
+        image.thumbnail((edge, edge))
+        if imageFormat == 'JPEG' and image.mode not in ('RGB', 'L'):
+            image = image.convert('RGB')
+        out = io.BytesIO()
+        image.save(out, format=imageFormat)
+        key = media.uuid + '/' + kind + '/' + media.name
+        s3.put_object(Body=out.getvalue(), Bucket=media_urls.bucket,
+                      Key=key, ContentType=media.mimetype)
+        renditions[kind] = key
+    media.renditions = renditions
+    items = Item.query.filter_by(media_id=media.id).all()
+    counters.touch(Post, *[row[0] for row in db.session.query(
+        Post.id).filter_by(media_id=media.id)])
+    counters.touch(Merchant, *{item.merchant_id for item in items})
+    feed.refresh_media(media)
+    db.session.commit()
+
+
+class RenditionWorker(object):
+    """Runs generate() off the request path on a small thread pool.
+
+    At most max_pending jobs are queued or running; submissions beyond
+    that are dropped and left for 'flask generate-renditions'. A failed
+    job is retried max_attempts times with exponential backoff.
+    """
+
+    def __init__(self, max_workers=MAX_WORKERS, max_pending=MAX_PENDING,
+                 max_attempts=MAX_ATTEMPTS, retry_delay=RETRY_DELAY):
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix='renditions')
+        self._slots = threading.BoundedSemaphore(max_pending)
+
+    def submit(self, app, media_id):
+        if not self._slots.acquire(blocking=False):
+            app.logger.warning(
+                'rendition queue full, skipping media %d', media_id)
+            return False
+        self._executor.submit(self._run, app, media_id)
+        return True
+
+    def _run(self, app, media_id):
+        try:
+            for attempt in range(self.max_attempts):
+                with app.app_context():
+                    try:
+                        generate(Media.query.get(media_id))
+                        return
+                    except Exception:
+                        db.session.rollback()
+                        app.logger.exception(
+                            'rendition of media %d failed (attempt %d)', media_id, attempt + 1)
+                    finally:
+                        db.session.remove()
+                time.sleep(self.retry_delay * 2 ** attempt)
+        finally:
+            self._slots.release()
+
+
+rendition_worker = RenditionWorker()
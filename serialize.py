@@ -0,0 +1,70 @@
+import json
+
+from flask import Response
+from marshmallow import fields
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+_encoders = {}
+_MISSING = object()
+
+
+def dumps(obj):
+    """Encode obj as compact UTF-8 JSON bytes, with orjson when it is installed."""
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def _nested_schema(field):
+    schema = field.schema
+    return schema if isinstance(schema, type) else type(schema)
+
+
+def _value_expr(field, env, var):
+    """Return Python source turning var into the JSON value of field."""
+    if isinstance(field, fields.Nested):
+        name = 'encode_%d' % len(env)
+        env[name] = encoder(_nested_schema(field))
+        if field.many:
+            return 'None if %s is None else [%s(x) for x in %s]' % (var, name, var)
+        return 'None if %s is None else %s(%s)' % (var, name, var)
+    if isinstance(field, fields.List) and isinstance(field.inner, fields.Nested):
+        inner = _value_expr(field.inner, env, 'x')
+        return 'None if %s is None else [%s for x in %s]' % (var, inner, var)
+    return var
+
+
+def encoder(schema):
+    """Return a compiled function projecting a payload dict onto schema.
+
+    The function keeps the schema's declared fields, in declaration
+    order, and recurses into nested schemas. Fields missing from the
+    payload are left out, as marshmallow's dump would. Values are passed
+    through as they are, so payloads must already hold JSON types.
+    """
+    compiled = _encoders.get(schema)
+    if compiled is not None:
+        return compiled
+    env = {'_MISSING': _MISSING}
+    lines = ['def encode(d):', '    out = {}']
+    for name, field in schema._declared_fields.items():
+        lines.append('    v = d.get(%r, _MISSING)' % name)
+        lines.append('    if v is not _MISSING:')
+        lines.append('        out[%r] = %s' % (field.data_key or name, _value_expr(field, env, 'v')))
+    lines.append('    return out')
+    exec(compile('\n'.join(lines), '<encoder %s>' % schema.__name__, 'exec'), env)
+    compiled = _encoders[schema] = env['encode']
+    return compiled
+
+
+def encode(schema, payload):
+    return dumps(encoder(schema)(payload))
+
+
+def response(schema, payload, status=200):
+    """Return a JSON response for payload, shaped by schema."""
+    return Response(encode(schema, payload), status=status, mimetype='application/json')
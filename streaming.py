@@ -0,0 +1,49 @@
+import os
+
+from flask import Response, request, stream_with_context
+
+import serialize
+
+STREAM_CHUNK_SIZE = int(os.getenv('STREAM_CHUNK_SIZE', 200))
+
+
+def wants_stream(args=None):
+    if args is None:
+        args = request.args
+    return args.get('stream', '').lower() in ('1', 'true', 'yes')
+
+
+def _chunks(rows, size):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def stream_list(schema, key, query, hydrate, extra=None, chunk_size=STREAM_CHUNK_SIZE):
+    """Stream {key: [...], **extra} as JSON, shaped by schema.
+
+    Rows come from query through a server-side cursor chunk_size at a
+    time. hydrate turns each chunk into payloads, which are encoded and
+    written out before the next chunk is fetched, so neither the first
+    byte nor memory waits on the length of the list.
+    """
+    encode = serialize.encoder(schema._declared_fields[key].inner.schema.__class__)
+    tail = serialize.dumps(serialize.encoder(schema)(extra or {}))[1:]
+
+    def generate():
+        yield b'{"' + key.encode() + b'":['
+        separator = b''
+        for chunk in _chunks(query.yield_per(chunk_size), chunk_size):
+            body = b','.join(serialize.dumps(encode(payload))
+                             for payload in hydrate(chunk))
+            if body:
+                yield separator + body
+                separator = b','
+        yield b']' + (b',' + tail if tail != b'}' else tail)
+
+    return Response(stream_with_context(generate()), mimetype='application/json')